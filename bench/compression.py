@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compare the CPU time and archive size of asset tarballs under each compression
+policy, for batches with different shares of already-compressed files.
+
+    python -m bench.compression [--files N] [--size BYTES]
+"""
+
+import argparse
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from submitter.archive import CompressionPolicy, open_tarball
+from submitter.submit import discover_assets, _write_asset_batch
+
+POLICIES = [
+    ('gzip', 9),
+    ('gzip', 6),
+    ('gzip', 1),
+    ('none', 0),
+    ('auto', 6)
+]
+
+def generate_tree(directory, files, size, precompressed_share, seed=0):
+    """
+    Write "files" synthetic assets of "size" bytes into "directory". Roughly
+    "precompressed_share" of them are incompressible .png files; the rest are
+    repetitive .css text.
+    """
+
+    rng = random.Random(seed)
+    words = [''.join(rng.choice('abcdefghij') for _ in range(6)) for _ in range(200)]
+
+    for i in range(files):
+        if rng.random() < precompressed_share:
+            path = os.path.join(directory, 'img-{:05d}.png'.format(i))
+            data = os.urandom(size)
+        else:
+            path = os.path.join(directory, 'style-{:05d}.css'.format(i))
+            text = ' '.join(rng.choice(words) for _ in range(size // 6))
+            data = text.encode('utf-8')[:size]
+        with open(path, 'wb') as f:
+            f.write(data)
+
+def measure(directory, batch, policy):
+    level = policy.level_for(batch)
+    buf = io.BytesIO()
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    tf = open_tarball(buf, level)
+    _write_asset_batch(tf, directory, batch)
+    tf.close()
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+
+    return level, cpu, wall, len(buf.getvalue())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--size', type=int, default=100000)
+    args = parser.parse_args()
+
+    print('{:>6} {:>5} {:>5} {:>9} {:>9} {:>12} {:>7}'.format(
+        'share', 'codec', 'level', 'cpu (s)', 'MB/s', 'bytes', 'ratio'
+    ))
+
+    for share in (0.0, 0.5, 0.9, 1.0):
+        directory = tempfile.mkdtemp()
+        try:
+            generate_tree(directory, args.files, args.size, share)
+            batch = list(discover_assets(directory).all())
+            raw = sum(a.size for a in batch)
+
+            for codec, level in POLICIES:
+                used, cpu, wall, size = measure(directory, batch, CompressionPolicy(codec, level))
+                print('{:>6.1f} {:>5} {:>5} {:>9.3f} {:>9.1f} {:>12} {:>7.3f}'.format(
+                    share, codec, used, cpu, raw / wall / 1000000, size, size / raw
+                ))
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""
+An in-process stand-in for the content service's /checkassets, /bulkasset,
+/checkcontent and /bulkcontent endpoints, mounted on a requests Session as a
+transport adapter so that submit() can run without a network.
+"""
+
+import hashlib
+import io
+import json
+import tarfile
+import threading
+import time
+from os.path import basename, splitext
+from urllib.parse import unquote, urlparse
+
+from requests import Session
+from requests.adapters import BaseAdapter
+from requests.models import Response
+
+class FakeContentService(BaseAdapter):
+    """
+    Keep assets and envelopes in memory, and answer content service API
+    requests about them. Each request is delayed by "latency" seconds to
+    approximate a round trip.
+    """
+
+    def __init__(self, latency=0):
+        super().__init__()
+        self.latency = latency
+        self.lock = threading.Lock()
+
+        # Fingerprints of the assets that have been uploaded.
+        self.assets = set()
+
+        # content ID -> fingerprint
+        self.envelopes = {}
+
+        # path -> number of requests
+        self.requests = {}
+
+    def session(self, url):
+        """
+        Return a Session that sends every request beneath "url" here.
+        """
+
+        session = Session()
+        session.mount(url, self)
+        return session
+
+    def send(self, request, **kwargs):
+        path = urlparse(request.url).path
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if path == '/checkassets':
+            body = self._checkassets(json.loads(_read_body(request.body).decode('utf-8')))
+        elif path == '/bulkasset':
+            body = self._bulkasset(_read_body(request.body))
+        elif path == '/checkcontent':
+            body = self._checkcontent(json.loads(_read_body(request.body).decode('utf-8')))
+        elif path == '/bulkcontent':
+            body = self._bulkcontent(_read_body(request.body))
+        else:
+            return _response(request, 404, {'error': 'Not found'})
+
+        return _response(request, 200, body)
+
+    def close(self):
+        pass
+
+    def _checkassets(self, query):
+        with self.lock:
+            return {
+                localpath: _public_url(localpath, fp) if fp in self.assets else None
+                for localpath, fp in query.items()
+            }
+
+    def _bulkasset(self, data):
+        response = {}
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:*') as tf:
+            for member in tf:
+                if not member.isfile():
+                    continue
+
+                fingerprint = hashlib.sha256(tf.extractfile(member).read()).hexdigest()
+                with self.lock:
+                    self.assets.add(fingerprint)
+                response[member.name] = _public_url(member.name, fingerprint)
+        return response
+
+    def _checkcontent(self, query):
+        with self.lock:
+            return {cid: self.envelopes.get(cid) == fp for cid, fp in query.items()}
+
+    def _bulkcontent(self, data):
+        content_id_base, keep, uploaded = '', set(), {}
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:*') as tf:
+            for member in tf:
+                if not member.isfile():
+                    continue
+
+                contents = tf.extractfile(member).read()
+                if member.name == 'metadata/config.json':
+                    content_id_base = json.loads(contents.decode('utf-8'))['contentIDBase']
+                elif member.name == 'metadata/keep.json':
+                    keep = set(json.loads(contents.decode('utf-8'))['keep'])
+                else:
+                    cid = unquote(splitext(basename(member.name))[0])
+                    uploaded[cid] = hashlib.sha256(contents).hexdigest()
+
+        with self.lock:
+            self.envelopes.update(uploaded)
+
+            deleted = [
+                cid for cid in self.envelopes
+                if cid.startswith(content_id_base) and cid not in keep and cid not in uploaded
+            ]
+            for cid in deleted:
+                del self.envelopes[cid]
+
+        return {'accepted': len(uploaded), 'failed': 0, 'deleted': len(deleted)}
+
+def _public_url(localpath, fingerprint):
+    stem, ext = splitext(basename(localpath))
+    return '/__local_asset__/{}-{}{}'.format(stem, fingerprint, ext)
+
+def _read_body(body):
+    """
+    Collect a request body sent as bytes, a file-like object, or an iterable
+    of chunks.
+    """
+
+    if body is None:
+        return b''
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    if isinstance(body, (bytes, bytearray)):
+        return bytes(body)
+    if hasattr(body, 'read'):
+        return body.read()
+    return b''.join(body)
+
+def _response(request, status, doc):
+    response = Response()
+    response.status_code = status
+    response.reason = 'OK' if status == 200 else 'Not Found'
+    response.headers['Content-Type'] = 'application/json'
+    response._content = json.dumps(doc).encode('utf-8')
+    response.encoding = 'utf-8'
+    response.request = request
+    response.url = request.url
+    return response
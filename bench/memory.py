@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compare the memory held by Assets and Envelopes for a large synthetic tree
+against the previous representation, which kept a __dict__ per instance and
+fingerprints as hex strings.
+
+    python -m bench.memory [--assets N] [--envelopes N]
+"""
+
+import argparse
+import gc
+import hashlib
+import tracemalloc
+
+from submitter.asset import Asset, AssetSet
+from submitter.envelope import Envelope, EnvelopeSet
+
+class DictAsset():
+    """
+    The previous Asset representation.
+    """
+
+    def __init__(self, localpath, fingerprint, size):
+        self.localpath = localpath
+        self.fingerprint = fingerprint
+        self.size = size
+        self.public_url = None
+
+class DictEnvelope():
+    """
+    The previous Envelope representation, holding only its fingerprint as it
+    does after being processed by an envelope worker.
+    """
+
+    def __init__(self, fname, fingerprint):
+        self.fname = fname
+        self._document = None
+        self._encoded = None
+        self.upload_needed = True
+        self._fingerprint = fingerprint
+
+def synthetic_paths(count):
+    return ['docs/section-{:03d}/page-{:07d}.png'.format(i // 1000, i) for i in range(count)]
+
+def synthetic_fingerprint(i):
+    return hashlib.sha256(str(i).encode('utf-8')).hexdigest()
+
+def build_assets(paths, compact):
+    asset_set = AssetSet()
+    for i, localpath in enumerate(paths):
+        if compact:
+            asset = Asset(localpath, fingerprint=synthetic_fingerprint(i), size=i)
+        else:
+            asset = DictAsset(localpath, synthetic_fingerprint(i), i)
+        asset.public_url = '/__local_asset__/page-{:07d}.png'.format(i)
+        asset_set.append(asset)
+    return asset_set
+
+def build_envelopes(count, compact):
+    envelope_set = EnvelopeSet()
+    for i in range(count):
+        fname = 'envelopes/https%3A%2F%2Fgithub.com%2Forg%2Frepo%2Fpage-{:07d}.json'.format(i)
+        if compact:
+            envelope = Envelope(fname, fingerprint=synthetic_fingerprint(i))
+        else:
+            envelope = DictEnvelope(fname, synthetic_fingerprint(i))
+        envelope_set.append(envelope)
+    return envelope_set
+
+def measure(build, *args):
+    """
+    Return the number of bytes still allocated by the structure that "build"
+    returns, excluding the strings passed to it.
+    """
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        structure = build(*args)
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    del structure
+    return after - before
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--assets', type=int, default=200000)
+    parser.add_argument('--envelopes', type=int, default=200000)
+    args = parser.parse_args()
+
+    paths = synthetic_paths(args.assets)
+
+    print('{:>10} {:>8} {:>14} {:>14} {:>10}'.format('kind', 'count', 'dict (MB)', 'slots (MB)', 'saved'))
+    for kind, count, build, build_args in (
+        ('assets', args.assets, build_assets, (paths,)),
+        ('envelopes', args.envelopes, build_envelopes, (args.envelopes,))
+    ):
+        old = measure(build, *(build_args + (False,)))
+        new = measure(build, *(build_args + (True,)))
+        print('{:>10} {:>8} {:>14.1f} {:>14.1f} {:>9.0%}'.format(
+            kind, count, old / 1000000, new / 1000000, 1 - new / old
+        ))
+
+if __name__ == '__main__':
+    main()
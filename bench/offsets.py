@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""
+Time Envelope.apply_asset_offsets over synthetic envelopes with many asset
+placeholders, against the previous string-concatenation implementation.
+
+    python -m bench.offsets [--offsets N ...] [--repeat N]
+"""
+
+import argparse
+import io
+import json
+import random
+import time
+
+from submitter.asset import Asset, AssetSet
+from submitter.envelope import Envelope
+
+def synthetic_asset_set(count):
+    asset_set = AssetSet()
+    for i in range(count):
+        localpath = 'images/asset-{:05d}.png'.format(i)
+        asset = Asset(localpath, fingerprint='0' * 64, size=0)
+        asset.public_url = 'https://assets.example.com/asset-{:05d}-{}.png'.format(i, '0' * 64)
+        asset_set.append(asset)
+    return asset_set
+
+def synthetic_envelope(offsets, assets, seed=0):
+    """
+    Return the JSON text of an envelope whose body has "offsets" placeholders,
+    each referring to one of "assets" assets, separated by filler markup.
+    """
+
+    rng = random.Random(seed)
+    body = []
+    asset_offsets = {}
+    position = 0
+    for i in range(offsets):
+        filler = '<p>' + 'lorem ipsum ' * rng.randint(1, 20) + '<img src="'
+        body.append(filler)
+        position += len(filler)
+
+        localpath = 'images/asset-{:05d}.png'.format(rng.randrange(assets))
+        asset_offsets.setdefault(localpath, []).append(position)
+        body.append('X')
+        position += 1
+
+        body.append('"></p>')
+        position += len('"></p>')
+
+    return json.dumps({'title': 'synthetic', 'body': ''.join(body), 'asset_offsets': asset_offsets})
+
+def concatenating_apply(document, asset_set):
+    """
+    The original implementation, which grows the result with +=.
+    """
+
+    paths_by_offset = {}
+    for localpath, offsets in document['asset_offsets'].items():
+        for offset in offsets:
+            paths_by_offset[offset] = localpath
+
+    body = document['body']
+    processed = ''
+    last = 0
+    for offset in sorted(paths_by_offset.keys()):
+        processed += body[last:offset]
+        processed += asset_set[paths_by_offset[offset]].public_url
+        last = offset + 1
+    processed += body[last:]
+
+    document['body'] = processed
+    del document['asset_offsets']
+
+def best_of(repeat, setup, fn):
+    """
+    Return the shortest time taken by fn(setup()) over "repeat" runs, excluding
+    the time spent in setup().
+    """
+
+    best = None
+    for i in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        fn(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--offsets', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--assets', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    asset_set = synthetic_asset_set(args.assets)
+
+    print('{:>8} {:>12} {:>14} {:>14}'.format('offsets', 'body chars', 'join (ms)', 'concat (ms)'))
+    for count in args.offsets:
+        text = synthetic_envelope(count, args.assets)
+
+        def setup():
+            return Envelope('page.json', io.StringIO(text))
+
+        joined = best_of(args.repeat, setup, lambda e: e.apply_asset_offsets(asset_set))
+        concatenated = best_of(args.repeat, setup, lambda e: concatenating_apply(e.document, asset_set))
+
+        print('{:>8} {:>12} {:>14.3f} {:>14.3f}'.format(
+            count,
+            len(json.loads(text)['body']),
+            joined * 1000,
+            concatenated * 1000
+        ))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+"""
+Run submit() end to end over a synthetic tree against an in-process fake
+content service, and report the throughput and peak memory of each phase.
+
+    python -m bench.pipeline [--assets N] [--envelopes N] [--set NAME=VALUE ...]
+
+Each run is appended to a results file along with the current commit, and
+compared with the last stored run of the same tree and settings. Phases that
+became slower than --threshold are reported as regressions.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import tracemalloc
+
+from submitter.config import Config
+from submitter.submit import submit
+
+from .fake_service import FakeContentService
+from .trees import TreeSpec, CONTENT_ID_BASE, generate_tree
+
+URL = 'http://bench.invalid'
+
+# Default path of the results file, relative to the repository root.
+RESULTS = os.path.join('bench', 'results.jsonl')
+
+# Phases shorter than this, in seconds, are too noisy to compare.
+MIN_SECONDS = 0.01
+
+def run_scenarios(asset_dir, envelope_dir, settings, latency=0, memory=True):
+    """
+    Submit the tree to an empty content service ("cold"), then submit it again
+    unchanged ("warm"). Return the metrics of each as a dict.
+    """
+
+    env = {
+        'ASSET_DIR': asset_dir,
+        'ENVELOPE_DIR': envelope_dir,
+        'CONTENT_SERVICE_URL': URL,
+        'CONTENT_SERVICE_APIKEY': 'bench',
+        'CONTENT_ID_BASE': CONTENT_ID_BASE
+    }
+    env.update(settings)
+    config = Config(env)
+    if not config.is_valid():
+        raise ValueError('Invalid settings: {}'.format(', '.join(config.missing() + config.problems)))
+
+    results = {}
+    for scenario in ('cold', 'warm'):
+        results[scenario] = run_scenario(config, latency, scenario == 'warm', memory)
+    return results
+
+def run_scenario(config, latency, warm, memory):
+    """
+    Time one scenario. If "memory" is set, run it a second time while tracing
+    allocations and merge in each phase's peak memory; tracing slows Python
+    down too much to take timings from the same run.
+    """
+
+    result = _submit(config, latency, warm, trace=False)
+    doc = result.metrics.as_dict()
+    doc['state'] = result.state
+
+    if memory:
+        traced = _submit(config, latency, warm, trace=True).metrics.as_dict()
+        for name, phase in doc['phases'].items():
+            phase['peak_memory'] = traced['phases'].get(name, {}).get('peak_memory', 0)
+
+    return doc
+
+def _submit(config, latency, warm, trace):
+    service = FakeContentService(latency=latency)
+    if warm:
+        submit(config, service.session(URL))
+
+    if trace:
+        tracemalloc.start()
+    try:
+        return submit(config, service.session(URL))
+    finally:
+        if trace:
+            tracemalloc.stop()
+
+def current_commit():
+    """
+    Return the current commit, marked if the working tree has changes, or None
+    outside of a git checkout.
+    """
+
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode('utf-8').strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'], stderr=subprocess.DEVNULL) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('+' if dirty else '')
+
+def load_baseline(path, record):
+    """
+    Return the most recent stored run with the same tree and settings as
+    "record", or None.
+    """
+
+    baseline = None
+    try:
+        with open(path, 'r') as rf:
+            for line in rf:
+                stored = json.loads(line)
+                if all(stored[key] == record[key] for key in ('spec', 'settings', 'latency')):
+                    baseline = stored
+    except FileNotFoundError:
+        pass
+    return baseline
+
+def regressions(record, baseline, threshold):
+    """
+    List the (scenario, phase, before, after) of each phase whose wall time grew
+    by more than "threshold" since "baseline". Phases that took less than
+    MIN_SECONDS both times are ignored.
+    """
+
+    found = []
+    for scenario, doc in record['scenarios'].items():
+        before_phases = baseline['scenarios'].get(scenario, {}).get('phases', {})
+        for name, phase in doc['phases'].items():
+            before = before_phases.get(name)
+            if before is None or max(before['seconds'], phase['seconds']) < MIN_SECONDS:
+                continue
+            if phase['seconds'] > before['seconds'] * (1 + threshold):
+                found.append((scenario, name, before['seconds'], phase['seconds']))
+    return found
+
+def report(record):
+    print('{:>5} {:>18} {:>6} {:>8} {:>10} {:>9} {:>9} {:>10} {:>9}'.format(
+        'run', 'phase', 'calls', 'items', 'MB', 'seconds', 'MB/s', 'items/s', 'peak MB'
+    ))
+    for scenario, doc in record['scenarios'].items():
+        for name in sorted(doc['phases']):
+            phase = doc['phases'][name]
+            seconds = phase['seconds']
+            print('{:>5} {:>18} {:>6} {:>8} {:>10.2f} {:>9.3f} {:>9} {:>10} {:>9.2f}'.format(
+                scenario,
+                name,
+                phase['calls'],
+                phase['items'],
+                phase['bytes'] / 1000000,
+                seconds,
+                '{:.1f}'.format(phase['bytes'] / seconds / 1000000) if seconds > 0 and phase['bytes'] else '-',
+                '{:.0f}'.format(phase['items'] / seconds) if seconds > 0 and phase['items'] else '-',
+                phase['peak_memory'] / 1000000
+            ))
+        print('{:>5} {:>18} {}'.format(scenario, 'state', doc['state']))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--assets', type=int, default=500)
+    parser.add_argument('--asset-size', type=int, default=20000, help='median asset size in bytes')
+    parser.add_argument('--asset-sigma', type=float, default=1.0, help='spread of asset sizes')
+    parser.add_argument('--envelopes', type=int, default=500)
+    parser.add_argument('--body-size', type=int, default=5000, help='envelope body size in characters')
+    parser.add_argument('--offsets', type=int, default=5, help='asset placeholders per envelope')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='submitter setting, e.g. ASSET_HASH_WORKERS=4')
+    parser.add_argument('--latency', type=float, default=0, help='simulated seconds per request')
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced run for peak memory')
+    parser.add_argument('--results', default=RESULTS, help='results file to append to')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown reported as a regression')
+    args = parser.parse_args()
+
+    spec = TreeSpec(
+        assets=args.assets,
+        asset_size=args.asset_size,
+        asset_sigma=args.asset_sigma,
+        envelopes=args.envelopes,
+        body_size=args.body_size,
+        offsets=args.offsets,
+        seed=args.seed
+    )
+    settings = dict(setting.split('=', 1) for setting in args.set)
+
+    root = tempfile.mkdtemp()
+    try:
+        asset_dir, envelope_dir = generate_tree(root, spec)
+        scenarios = run_scenarios(asset_dir, envelope_dir, settings, args.latency, not args.no_memory)
+    finally:
+        shutil.rmtree(root)
+
+    record = {
+        'commit': current_commit(),
+        'time': datetime.datetime.utcnow().isoformat() + 'Z',
+        'spec': spec.as_dict(),
+        'settings': settings,
+        'latency': args.latency,
+        'scenarios': scenarios
+    }
+    report(record)
+
+    baseline = load_baseline(args.results, record)
+    if baseline is not None:
+        print()
+        found = regressions(record, baseline, args.threshold)
+        for scenario, name, before, after in found:
+            print('Regression in {} {}: {:.3f}s -> {:.3f}s since {}.'.format(
+                scenario, name, before, after, baseline['commit']
+            ))
+        if not found:
+            print('No regressions since {}.'.format(baseline['commit']))
+
+    with open(args.results, 'a') as rf:
+        rf.write(json.dumps(record, sort_keys=True) + '\n')
+
+if __name__ == '__main__':
+    main()
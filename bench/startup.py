@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measure how long the submitter takes to start, using the interpreter's
+-X importtime report where there is one, and check that modules only some
+runs need are not imported by runs that don't.
+
+    python -m bench.startup [--repeat N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Each scenario's interpreter arguments, and the modules that it must not
+# import.
+SCENARIOS = {
+    # A run without configuration, which reports the problem and exits.
+    'invalid': (
+        ['-m', 'submitter'],
+        ('submitter.submit', 'requests', 'asyncio', 'tarfile', 'sqlite3', 'concurrent.futures')
+    ),
+    # Everything a single submit loads before it contacts the content service.
+    'submit': (
+        ['-c', 'import submitter.__main__, submitter.submit'],
+        ('asyncio', 'tarfile', 'sqlite3', 'tracemalloc', 'concurrent.futures')
+    ),
+    # A watching run, before its first submit.
+    'watch': (
+        ['-c', 'import submitter.__main__, submitter.watch'],
+        ('asyncio', 'tarfile', 'tracemalloc', 'concurrent.futures')
+    )
+}
+
+# Runs a scenario's "-m" module or "-c" command, and lists the modules that it
+# imported once it exits. Stands in for -X importtime, which is new in
+# Python 3.7.
+MODULE_PROBE = """
+import atexit, runpy, sys
+atexit.register(lambda: sys.stderr.write(''.join('imported: {}\\n'.format(name) for name in sorted(sys.modules))))
+option, target = sys.argv[1:3]
+sys.argv = sys.argv[2:]
+if option == '-m':
+    runpy.run_module(target, run_name='__main__', alter_sys=True)
+else:
+    exec(compile(target, '<string>', 'exec'), {'__name__': '__main__'})
+"""
+
+def measure_startup(args, env=None, importtime=None):
+    """
+    Run the interpreter with "args" and the environment "env" under
+    -X importtime. Return its exit status, its wall time in seconds, and a
+    map of each module it imported to its cumulative import time in
+    microseconds.
+
+    Unless "importtime" is given, it's used only on interpreters that support
+    it. Otherwise, "args" are run by MODULE_PROBE and every import time is
+    reported as 0.
+    """
+
+    if env is None:
+        env = {'PATH': os.environ.get('PATH', '')}
+    if importtime is None:
+        importtime = sys.version_info >= (3, 7)
+
+    if importtime:
+        command, parse = [sys.executable, '-X', 'importtime'] + args, parse_importtime
+    else:
+        command, parse = [sys.executable, '-c', MODULE_PROBE] + args, parse_module_list
+
+    start = time.perf_counter()
+    process = subprocess.run(
+        command,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    elapsed = time.perf_counter() - start
+
+    return process.returncode, elapsed, parse(process.stderr)
+
+def parse_importtime(report):
+    """
+    Parse the lines of an -X importtime report into a map of module names to
+    cumulative import times in microseconds.
+    """
+
+    modules = {}
+    for line in report.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+
+        modules[fields[2].strip()] = int(fields[1])
+    return modules
+
+def parse_module_list(report):
+    """
+    Parse the module names listed by MODULE_PROBE into a map of module names to
+    cumulative import times, which aren't known and so are all 0.
+    """
+
+    return {
+        line[len('imported: '):]: 0
+        for line in report.splitlines()
+        if line.startswith('imported: ')
+    }
+
+def unexpected_imports(modules, deferred):
+    """
+    Return those of the "deferred" modules that were imported, along with any
+    of their submodules.
+    """
+
+    return sorted(
+        d for d in deferred
+        if any(name == d or name.startswith(d + '.') for name in modules)
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='runs per scenario; the fastest is reported')
+    args = parser.parse_args()
+
+    print('{:>10} {:>8} {:>12} {:>10} {:>8}'.format('scenario', 'status', 'wall (ms)', 'modules', 'guard'))
+    failed = False
+    for name, (scenario_args, deferred) in sorted(SCENARIOS.items()):
+        runs = [measure_startup(scenario_args) for _ in range(args.repeat)]
+        status, elapsed, modules = min(runs, key=lambda run: run[1])
+
+        unexpected = unexpected_imports(modules, deferred)
+        print('{:>10} {:>8} {:>12.1f} {:>10} {:>8}'.format(
+            name, status, elapsed * 1000, len(modules), 'ok' if not unexpected else 'FAILED'
+        ))
+        for module in unexpected:
+            print('  imported {} ({:.1f} ms)'.format(module, modules.get(module, 0) / 1000))
+        failed = failed or bool(unexpected)
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
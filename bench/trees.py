@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""
+Generate synthetic asset and envelope trees for benchmarks.
+"""
+
+import json
+import math
+import os
+import random
+from urllib.parse import quote
+
+CONTENT_ID_BASE = 'https://github.com/bench/repo/'
+
+class TreeSpec():
+    """
+    The shape of a synthetic tree. Asset sizes follow a log-normal distribution
+    around "asset_size" bytes, so that most assets are small and a few are
+    large. Each envelope has a body of roughly "body_size" characters with
+    "offsets" asset placeholders.
+    """
+
+    def __init__(self, assets=500, asset_size=20000, asset_sigma=1.0, envelopes=500,
+                 body_size=5000, offsets=5, seed=0):
+        self.assets = assets
+        self.asset_size = asset_size
+        self.asset_sigma = asset_sigma
+        self.envelopes = envelopes
+        self.body_size = body_size
+        self.offsets = offsets
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+    def __repr__(self):
+        return '{}({})'.format(
+            self.__class__.__name__,
+            ','.join('{}={}'.format(k, v) for k, v in sorted(self.__dict__.items()))
+        )
+
+def generate_tree(root, spec):
+    """
+    Write the assets and envelopes described by "spec" into "assets" and
+    "envelopes" directories beneath "root". Return their paths.
+    """
+
+    asset_dir = os.path.join(root, 'assets')
+    envelope_dir = os.path.join(root, 'envelopes')
+    os.makedirs(asset_dir)
+    os.makedirs(envelope_dir)
+
+    rng = random.Random(spec.seed)
+    localpaths = generate_assets(asset_dir, spec, rng)
+    generate_envelopes(envelope_dir, spec, localpaths, rng)
+
+    return asset_dir, envelope_dir
+
+def generate_assets(directory, spec, rng):
+    """
+    Write "spec.assets" files of random contents, ten to a subdirectory.
+    Return their paths relative to "directory".
+    """
+
+    mu = math.log(spec.asset_size)
+    localpaths = []
+    for i in range(spec.assets):
+        localpath = os.path.join('dir-{:04d}'.format(i // 10), 'asset-{:06d}.bin'.format(i))
+        fullpath = os.path.join(directory, localpath)
+        os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+
+        size = max(1, int(rng.lognormvariate(mu, spec.asset_sigma)))
+        with open(fullpath, 'wb') as af:
+            af.write(os.urandom(size))
+        localpaths.append(localpath)
+    return localpaths
+
+def generate_envelopes(directory, spec, localpaths, rng):
+    """
+    Write "spec.envelopes" envelopes whose placeholders refer to randomly
+    chosen assets from "localpaths".
+    """
+
+    filler = 'lorem ipsum dolor sit amet '
+    for i in range(spec.envelopes):
+        segments = spec.offsets + 1
+        segment = filler * max(1, spec.body_size // segments // len(filler))
+
+        body, asset_offsets, position = [], {}, 0
+        for n in range(segments):
+            body.append(segment)
+            position += len(segment)
+
+            if n < spec.offsets and localpaths:
+                asset_offsets.setdefault(rng.choice(localpaths), []).append(position)
+                body.append('X')
+                position += 1
+
+        document = {'title': 'page {}'.format(i), 'body': ''.join(body)}
+        if asset_offsets:
+            document['asset_offsets'] = asset_offsets
+
+        content_id = '{}page-{:06d}'.format(CONTENT_ID_BASE, i)
+        with open(os.path.join(directory, quote(content_id, safe='') + '.json'), 'w') as ef:
+            json.dump(document, ef)
@@ -1,15 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+# Only what every run needs is imported here. The submit machinery, and the
+# requests and asyncio stacks beneath it, are imported once the configuration
+# is known to be valid, so that a misconfigured run exits without them.
+
 import os
 import logging
 import sys
 from datetime import datetime
 
 from .config import Config
-from .submit import submit, SUCCESS, NOOP
-
-c = Config(os.environ)
 
 # Configure the logger.
 # <= INFO to stdout
@@ -26,60 +27,169 @@ class LessThanFilter(logging.Filter):
         else:
             return 0
 
-if c.verbose:
-    level=logging.DEBUG
-else:
-    level=logging.INFO
-
-rootLogger = logging.getLogger()
-rootLogger.setLevel(level)
-
-plainFormatter = logging.Formatter('%(message)s')
-
-outHandler = logging.StreamHandler(sys.stdout)
-outHandler.setLevel(logging.DEBUG)
-outHandler.addFilter(LessThanFilter(logging.WARNING))
-outHandler.setFormatter(plainFormatter)
-rootLogger.addHandler(outHandler)
-
-errHandler = logging.StreamHandler(sys.stderr)
-errHandler.setLevel(logging.WARNING)
-errHandler.setFormatter(plainFormatter)
-rootLogger.addHandler(errHandler)
-
-# Squelch requests and urllib messages.
-logging.getLogger("requests").setLevel(logging.WARNING)
-logging.getLogger("urllib3").setLevel(logging.WARNING)
-
-if not c.is_valid():
-    logging.error('Invalid configuration. Fix the following environment variables:')
-    for var in c.missing():
-        logging.error("  " + var)
-    for problem in c.problems:
+def configure_logging(verbose):
+    if verbose:
+        level=logging.DEBUG
+    else:
+        level=logging.INFO
+
+    rootLogger = logging.getLogger()
+    rootLogger.setLevel(level)
+
+    plainFormatter = logging.Formatter('%(message)s')
+
+    outHandler = logging.StreamHandler(sys.stdout)
+    outHandler.setLevel(logging.DEBUG)
+    outHandler.addFilter(LessThanFilter(logging.WARNING))
+    outHandler.setFormatter(plainFormatter)
+    rootLogger.addHandler(outHandler)
+
+    errHandler = logging.StreamHandler(sys.stderr)
+    errHandler.setLevel(logging.WARNING)
+    errHandler.setFormatter(plainFormatter)
+    rootLogger.addHandler(errHandler)
+
+    # Squelch requests and urllib messages.
+    logging.getLogger("requests").setLevel(logging.WARNING)
+    logging.getLogger("urllib3").setLevel(logging.WARNING)
+
+def exit_with(state):
+    from .submit import SUCCESS, NOOP
+
+    if state is SUCCESS:
+        sys.exit(0)
+    elif state is NOOP:
+        # Signal to the Strider plugin that we did nothing.
+        sys.exit(2)
+    else:
+        sys.exit(1)
+
+def report_invalid(config, name='environment variables', missing=True):
+    """
+    Report the problems with "config" and exit. Unless "missing" is False,
+    required settings that aren't set are reported too.
+    """
+
+    logging.error('Invalid configuration. Fix the following {}:'.format(name))
+    if missing:
+        for var in config.missing():
+            logging.error("  " + var)
+    for problem in config.problems:
         logging.error("  " + problem)
     sys.exit(1)
 
-start = datetime.utcnow()
-result = submit(c)
-finish = datetime.utcnow()
-
-pattern = 'Submitted {asset_uploaded} / {asset_total} assets and ' \
-    '{envelope_uploaded} / {envelope_total} envelopes in {duration}.'
-summary = pattern.format(
-    asset_uploaded=result.asset_result.uploaded,
-    asset_total=len(result.asset_result.asset_set),
-    envelope_uploaded=result.envelope_result.uploaded,
-    envelope_total=len(result.envelope_result.envelope_set),
-    duration=finish - start
-)
-logging.info(summary)
-
-if result.state is SUCCESS:
+def run_jobs_manifest(c):
+    """
+    Submit each job listed in the jobs manifest from this one process.
+    """
+
+    from .jobs import load_jobs, job_configs, run_jobs, aggregate_state
+
+    # Each job may give the required settings, so only the values that are
+    # set are checked here.
+    if c.problems:
+        report_invalid(c, missing=False)
+
+    try:
+        jobs = load_jobs(c.jobs)
+    except (OSError, ValueError) as e:
+        logging.error('Unable to read the jobs manifest {}: {}'.format(c.jobs, e))
+        sys.exit(1)
+
+    configs = job_configs(os.environ, jobs)
+    for n, job_config in enumerate(configs, 1):
+        if not job_config.is_valid():
+            report_invalid(job_config, 'settings of job {}'.format(n))
+
+    start = datetime.utcnow()
+    job_results = run_jobs(configs, concurrency=c.jobs_concurrency, pool_size=c.pool_size * c.jobs_concurrency)
+    finish = datetime.utcnow()
+
+    for job_result in job_results:
+        if job_result.result is None:
+            logging.error('{}: failed with {}.'.format(job_result.config.content_id_base, job_result.error))
+            continue
+
+        result = job_result.result
+        logging.info('{}: submitted {} / {} assets and {} / {} envelopes.'.format(
+            job_result.config.content_id_base,
+            result.asset_result.uploaded,
+            len(result.asset_result.asset_set),
+            result.envelope_result.uploaded,
+            len(result.envelope_result.envelope_set)
+        ))
+
+    state = aggregate_state(job_results)
+    logging.info('Completed {} jobs in {}: {}.'.format(len(job_results), finish - start, state))
+    exit_with(state)
+
+def watch(c):
+    """
+    Keep running, and submit again whenever the site's files change.
+    """
+
+    from .watch import Watcher, DEFAULT_INTERVAL, DEFAULT_DEBOUNCE
+
+    watcher = Watcher(
+        c,
+        interval=c.watch_interval or DEFAULT_INTERVAL,
+        debounce=c.watch_debounce or DEFAULT_DEBOUNCE
+    )
+    logging.info('Watching {} and {} for changes.'.format(c.asset_dir, c.envelope_dir))
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    logging.info('Stopped watching after {} submits.'.format(watcher.submits))
     sys.exit(0)
-elif result.state is NOOP:
-    # Signal to the Strider plugin that we did nothing.
-    sys.exit(2)
-else:
-    # FAILURE
-    logging.error('Failed to upload {} envelopes.'.format(result.envelope_result.failed))
-    sys.exit(1)
+
+def submit_once(c):
+    """
+    Submit the site once and exit with a status reflecting the result.
+    """
+
+    from .submit import submit, SUCCESS, NOOP
+
+    start = datetime.utcnow()
+    result = submit(c)
+    finish = datetime.utcnow()
+
+    pattern = 'Submitted {asset_uploaded} / {asset_total} assets and ' \
+        '{envelope_uploaded} / {envelope_total} envelopes in {duration}.'
+    summary = pattern.format(
+        asset_uploaded=result.asset_result.uploaded,
+        asset_total=len(result.asset_result.asset_set),
+        envelope_uploaded=result.envelope_result.uploaded,
+        envelope_total=len(result.envelope_result.envelope_set),
+        duration=finish - start
+    )
+    if result.asset_result.deduplicated:
+        summary += ' Skipped {} duplicate assets, saving {} bytes.'.format(
+            result.asset_result.deduplicated,
+            result.asset_result.bytes_saved
+        )
+    if result.retries:
+        summary += ' Retried {} failed requests.'.format(result.retries)
+    logging.info(summary)
+
+    if result.state is not SUCCESS and result.state is not NOOP:
+        logging.error('Failed to upload {} envelopes.'.format(result.envelope_result.failed))
+    exit_with(result.state)
+
+def main():
+    c = Config(os.environ)
+    configure_logging(c.verbose)
+
+    if c.jobs:
+        run_jobs_manifest(c)
+
+    if not c.is_valid():
+        report_invalid(c)
+
+    if c.watch:
+        watch(c)
+
+    submit_once(c)
+
+if __name__ == '__main__':
+    main()
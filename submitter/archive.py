@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+import queue
+import threading
+from os.path import splitext
+
+# Number of chunks that may be waiting for the uploader before the archive
+# writer blocks.
+QUEUE_DEPTH = 32
+
+# Writes are coalesced into chunks of at least this many bytes before they're
+# handed to the uploader.
+CHUNK_SIZE = 64 * 1024
+
+# Compression codecs understood by the content service. It only accepts
+# tar+gzip archives, so "none" is implemented as gzip at level 0: a valid gzip
+# stream of stored blocks that costs almost no CPU to produce.
+CODECS = ('gzip', 'none', 'auto')
+
+# File extensions whose contents are already compressed, so that deflating them
+# again costs CPU for little or no reduction in size.
+PRECOMPRESSED_EXTENSIONS = frozenset([
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico',
+    '.woff', '.woff2',
+    '.mp3', '.mp4', '.m4a', '.m4v', '.mov', '.webm', '.ogg', '.ogv',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.jar',
+    '.pdf'
+])
+
+# With the "auto" codec, batches in which at least this share of bytes belongs
+# to already-compressed files are stored without compression.
+PRECOMPRESSED_THRESHOLD = 0.8
+
+class CompressionPolicy():
+    """
+    Choose the gzip compression level to use for each asset archive.
+    """
+
+    def __init__(self, codec='gzip', level=9):
+        self.codec = codec
+        self.level = level
+
+    def level_for(self, assets):
+        """
+        Return the compression level to use for an archive containing "assets".
+        """
+
+        if self.codec == 'none':
+            return 0
+
+        if self.codec == 'auto':
+            if precompressed_share(assets) >= PRECOMPRESSED_THRESHOLD:
+                return 0
+
+        return self.level
+
+    def __repr__(self):
+        return '{}(codec={},level={})'.format(self.__class__.__name__, self.codec, self.level)
+
+def precompressed_share(assets):
+    """
+    Return the fraction of bytes among "assets" that belong to files with
+    already-compressed types, judged by extension.
+    """
+
+    total, precompressed = 0, 0
+    for asset in assets:
+        size = asset.size or 0
+        total += size
+        if splitext(asset.localpath)[1].lower() in PRECOMPRESSED_EXTENSIONS:
+            precompressed += size
+
+    if total == 0:
+        return 0.0
+    return precompressed / total
+
+def open_tarball(fileobj, compresslevel=9):
+    """
+    Open a gzipped TarFile for writing into "fileobj". The file object only
+    needs to support write(), so it may be a pipe or a stream_archive writer.
+    """
+
+    # Imported here so that submits with nothing to upload never load tarfile.
+    import tarfile
+
+    return tarfile.open(fileobj=fileobj, mode='w:gz', compresslevel=compresslevel)
+
+_DONE = object()
+
+class _QueueWriter():
+    """
+    A write-only file object that hands the bytes written to it to a bounded
+    queue in chunks of at least CHUNK_SIZE, blocking while the queue is full.
+    """
+
+    def __init__(self, chunks, abort):
+        self.chunks = chunks
+        self.abort = abort
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        # Never emit an empty chunk: it would end a chunked request body.
+        if self.buffer:
+            self._put(bytes(self.buffer))
+            self.buffer = bytearray()
+
+    def _put(self, item):
+        while True:
+            if self.abort.is_set():
+                raise IOError('Archive upload was abandoned')
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+def stream_archive(build, queue_depth=QUEUE_DEPTH):
+    """
+    Call build(fileobj) on a background thread, where "fileobj" is a write-only
+    file object that tarfile can write into. Generate each chunk of bytes as it
+    is written, so that the archive never exists in memory as a whole. The
+    generator can be passed directly as a request body to upload it with
+    chunked transfer encoding.
+
+    Any exception raised by "build" is re-raised from the generator.
+    """
+
+    chunks = queue.Queue(maxsize=queue_depth)
+    abort = threading.Event()
+    failure = []
+
+    def produce():
+        writer = _QueueWriter(chunks, abort)
+        try:
+            build(writer)
+            writer.flush()
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            try:
+                writer._put(_DONE)
+            except IOError:
+                pass
+
+    producer = threading.Thread(target=produce, name='archive-writer', daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _DONE:
+                break
+            yield chunk
+    finally:
+        # Release the producer if the consumer stopped early.
+        abort.set()
+        producer.join()
+
+    if failure:
+        raise failure[0]
@@ -2,16 +2,85 @@
 
 import hashlib
 
+# Assets are hashed in fixed-size chunks so that memory use stays constant
+# regardless of how large an individual asset is.
+CHUNK_SIZE = 1024 * 1024
+
+def fingerprint_stream(stream, chunk_size=CHUNK_SIZE):
+    """
+    Compute the SHA256 checksum of a binary stream, reading it chunk_size bytes
+    at a time. Return the hex digest and the number of bytes that were hashed.
+    """
+
+    digest, size = digest_stream(stream, chunk_size)
+    return digest.hex(), size
+
+def digest_stream(stream, chunk_size=CHUNK_SIZE):
+    """
+    Like fingerprint_stream, but return the raw 32-byte digest.
+    """
+
+    h = hashlib.sha256()
+    size = 0
+
+    readinto = getattr(stream, 'readinto', None)
+    if readinto is not None:
+        # Reuse a single buffer for every chunk, as hashlib.file_digest does.
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        while True:
+            n = readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+            size += n
+    else:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+            size += len(chunk)
+
+    return h.digest(), size
+
 class Asset():
     """
     An asset file discovered beneath ASSET_DIR.
+
+    One Asset is held for every file in the tree, so instances are slotted and
+    keep their fingerprint as a raw SHA256 digest rather than a hex string.
     """
 
-    def __init__(self, localpath, stream):
+    __slots__ = ('localpath', 'size', 'public_url', '_digest')
+
+    def __init__(self, localpath, stream=None, fingerprint=None, size=None):
+        """
+        Fingerprint the asset's contents from "stream", or accept a previously
+        computed "fingerprint" and "size" when no stream is given.
+        """
+
         self.localpath = localpath
-        self.fingerprint = hashlib.sha256(stream.read()).hexdigest()
+        if stream is not None:
+            self._digest, self.size = digest_stream(stream)
+        else:
+            self.fingerprint, self.size = fingerprint, size
         self.public_url = None
 
+    @property
+    def fingerprint(self):
+        """
+        The SHA256 checksum of the asset's contents, as a hex string.
+        """
+
+        if self._digest is None:
+            return None
+        return self._digest.hex()
+
+    @fingerprint.setter
+    def fingerprint(self, fingerprint):
+        self._digest = bytes.fromhex(fingerprint) if fingerprint is not None else None
+
     def needs_upload(self):
         """
         Return true if this asset should be included within the asset tarball.
@@ -54,6 +123,11 @@ class Asset():
 class AssetSet():
     """
     The collection of all assets discovered within the asset directory.
+
+    Copies of the same file at different paths share one upload: the content
+    service names each public URL after the uploaded file's name and
+    fingerprint, so assets with the same name and contents receive the same
+    public URL, which is given to every copy once any of them has one.
     """
 
     def __init__(self):
@@ -62,6 +136,13 @@ class AssetSet():
     def append(self, asset):
         self.assets[asset.localpath] = asset
 
+    def discard(self, localpath):
+        """
+        Remove the Asset at "localpath", if there is one.
+        """
+
+        self.assets.pop(localpath, None)
+
     def fingerprint_query(self):
         """
         Construct a query payload for the content service's /checkassets
@@ -72,14 +153,32 @@ class AssetSet():
 
         return {localpath: a.fingerprint for localpath, a in self.assets.items()}
 
+    def public_urls(self):
+        """
+        Return a map of each asset's local path to its public URL.
+        """
+
+        return {localpath: a.public_url for localpath, a in self.assets.items()}
+
     def accept_urls(self, response):
         """
-        Update Asset states with the response of a /checkassets query.
+        Update Asset states with the response of a /checkassets query or a
+        /bulkasset call, then share each public URL with copies of its asset.
         """
 
         for asset in self.all():
             asset.accept_url(response)
 
+        public_urls = {}
+        for asset in self.all():
+            if asset.public_url:
+                public_urls.setdefault(_content_key(asset), asset.public_url)
+
+        for asset in self.to_upload():
+            public_url = public_urls.get(_content_key(asset))
+            if public_url is not None:
+                asset.public_url = public_url
+
     def to_upload(self):
         """
         Generate each Asset that must be uploaded to the content service.
@@ -89,6 +188,31 @@ class AssetSet():
             if asset.needs_upload():
                 yield asset
 
+    def unique_uploads(self):
+        """
+        Generate the copy with the first local path of each group of copies
+        that must be uploaded to the content service, in local path order.
+        """
+
+        seen = set()
+        for asset in sorted(self.to_upload(), key=lambda a: a.localpath):
+            key = _content_key(asset)
+            if key not in seen:
+                seen.add(key)
+                yield asset
+
+    def duplicate_uploads(self):
+        """
+        Return each Asset that must be uploaded, but that is a copy of another
+        that will be uploaded in its place, in local path order.
+        """
+
+        unique = set(id(asset) for asset in self.unique_uploads())
+        return sorted(
+            (asset for asset in self.to_upload() if id(asset) not in unique),
+            key=lambda a: a.localpath
+        )
+
     def all(self):
         """
         Generate all Assets.
@@ -116,3 +240,10 @@ class AssetSet():
 
     def __str__(self):
         return '{}(assets x{})'.format(self.__class__.__name__, len(self))
+
+def _content_key(asset):
+    """
+    Return the key shared by copies of an asset: its file name and digest.
+    """
+
+    return asset.localpath.rsplit('/', 1)[-1], asset._digest
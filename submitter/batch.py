@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+
+# The block size of the tar format, as tarfile.BLOCKSIZE.
+TAR_BLOCKSIZE = 512
+
+def tar_entry_size(size):
+    """
+    Estimate the number of bytes that a file of "size" bytes occupies within an
+    uncompressed tar archive: one header block plus its contents, padded to a
+    whole number of blocks.
+    """
+
+    return TAR_BLOCKSIZE + -(-size // TAR_BLOCKSIZE) * TAR_BLOCKSIZE
+
+def asset_measure(asset):
+    """
+    Return the size and name by which an asset is planned into a batch.
+    """
+
+    return asset.size or 0, asset.localpath
+
+class BatchPlan():
+    """
+    A division of assets into tarball batches of balanced size, planned from
+    the asset sizes gathered during discovery.
+
+    Assets too large to share a batch are given a batch of their own. The rest
+    are packed largest-first into the least full of the fewest batches that
+    can hold them, opening a new batch only when an asset would push the
+    emptiest one past "batch_size".
+
+    Other items may be planned by passing a "measure" function that returns
+    the size and name of each.
+    """
+
+    def __init__(self, assets, batch_size, measure=asset_measure):
+        self.batch_size = batch_size
+        self.batches = []
+        self.sizes = []
+
+        packable = []
+        for asset in assets:
+            size, name = measure(asset)
+            entry_size = tar_entry_size(size)
+            if entry_size >= batch_size:
+                self.batches.append([asset])
+                self.sizes.append(entry_size)
+            else:
+                packable.append((entry_size, name, asset))
+
+        if not packable:
+            return
+
+        # Largest first; ties are broken by name so that plans are stable.
+        packable.sort(key=lambda entry: (-entry[0], entry[1]))
+
+        total = sum(entry_size for entry_size, name, asset in packable)
+        count = max(1, -(-total // batch_size))
+
+        first = len(self.batches)
+        heap = []
+        for i in range(count):
+            self.batches.append([])
+            self.sizes.append(0)
+            heap.append((0, first + i))
+        heapq.heapify(heap)
+
+        for entry_size, name, asset in packable:
+            size, i = heapq.heappop(heap)
+            if size > 0 and size + entry_size > batch_size:
+                # Even the emptiest batch is too full. Start another.
+                heapq.heappush(heap, (size, i))
+                self.batches.append([])
+                self.sizes.append(0)
+                i = len(self.batches) - 1
+
+            self.batches[i].append(asset)
+            self.sizes[i] += entry_size
+            heapq.heappush(heap, (self.sizes[i], i))
+
+    def total(self):
+        """
+        Return the estimated uncompressed size of all batches, in bytes.
+        """
+
+        return sum(self.sizes)
+
+    def __iter__(self):
+        return iter(self.batches)
+
+    def __len__(self):
+        return len(self.batches)
+
+    def __repr__(self):
+        return '{}(batch_size={},sizes={})'.format(
+            self.__class__.__name__,
+            self.batch_size,
+            self.sizes
+        )
+
+    def __str__(self):
+        return '{}(batches x{}, {} bytes)'.format(
+            self.__class__.__name__,
+            len(self),
+            self.total()
+        )
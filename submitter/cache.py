@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+# Version of the fingerprints table. A database written with another version
+# is discarded and rebuilt.
+SCHEMA_VERSION = 2
+
+class FingerprintCache():
+    """
+    A persistent map from a file's path and stat() results to its SHA256
+    fingerprint, stored in a SQLite database between runs. A cached
+    fingerprint is reused only while the file's size, mtime and inode are
+    unchanged.
+
+    Fingerprints that depend on more than the file's own contents, like those of
+    envelopes with asset offsets, are stored with a "salt" that must also match,
+    and with the local paths of the assets that the salt was computed from.
+
+    If "path" is None, fingerprints are kept in memory only, for reuse by later
+    submits from the same process.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.updates = {}
+        self.seen = set()
+
+        if self.path is None:
+            return
+
+        with sqlite3.connect(self.path) as db:
+            if db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                db.execute('DROP TABLE IF EXISTS fingerprints')
+                db.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS fingerprints ('
+                'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+                'inode INTEGER, salt TEXT, fingerprint TEXT, assets TEXT)'
+            )
+            for row in db.execute('SELECT * FROM fingerprints'):
+                self.entries[row[0]] = row[1:]
+        db.close()
+
+        logging.debug('Loaded {} cached fingerprints from {}.'.format(len(self.entries), self.path))
+
+    def lookup(self, path, st, salt=''):
+        """
+        Return the cached fingerprint of the file at "path" if its stat() results
+        "st" and "salt" match those recorded when it was stored, or None.
+        """
+
+        key = os.path.abspath(path)
+        expected = (st.st_size, st.st_mtime_ns, st.st_ino, salt)
+
+        with self.lock:
+            self.seen.add(key)
+            entry = self.entries.get(key)
+            if entry is not None and tuple(entry[:4]) == expected:
+                self.hits += 1
+                return entry[4]
+
+            self.misses += 1
+            return None
+
+    def candidate(self, path, st):
+        """
+        Return the (salt, fingerprint, assets) cached for the file at "path" if
+        its stat() results "st" are unchanged, or None. Unlike lookup(), this
+        does not count as a hit or a miss; it lets the salt be computed again
+        from the stored asset local paths, without reading the file, to decide
+        whether the cached fingerprint applies.
+        """
+
+        entry = self.entries.get(os.path.abspath(path))
+        if entry is not None and tuple(entry[:3]) == (st.st_size, st.st_mtime_ns, st.st_ino):
+            return entry[3], entry[4], json.loads(entry[5])
+        return None
+
+    def store(self, path, st, fingerprint, salt='', assets=()):
+        """
+        Record the fingerprint of the file at "path", as of the stat() results "st",
+        along with the local paths of the "assets" that its "salt" depends on.
+        """
+
+        key = os.path.abspath(path)
+        entry = (st.st_size, st.st_mtime_ns, st.st_ino, salt, fingerprint, json.dumps(list(assets)))
+
+        with self.lock:
+            self.seen.add(key)
+            self.entries[key] = entry
+            self.updates[key] = entry
+
+    def retain(self, paths):
+        """
+        Count the files at "paths" as seen, so that the next save() keeps their
+        fingerprints even if they weren't looked up.
+        """
+
+        with self.lock:
+            self.seen.update(os.path.abspath(path) for path in paths)
+
+    def save(self):
+        """
+        Write new fingerprints to disk and forget any files that were not seen
+        since the last save.
+        """
+
+        with self.lock:
+            stale = [(key,) for key in self.entries if key not in self.seen]
+            updates = [(key,) + entry for key, entry in self.updates.items()]
+
+            if self.path is not None:
+                with sqlite3.connect(self.path) as db:
+                    db.executemany('DELETE FROM fingerprints WHERE path = ?', stale)
+                    db.executemany(
+                        'INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        updates
+                    )
+                db.close()
+
+            for (key,) in stale:
+                del self.entries[key]
+            self.updates.clear()
+            self.seen.clear()
+
+        logging.debug('Saved {} updated fingerprints to {}.'.format(len(updates), self.path))
+
+    def __repr__(self):
+        return '{}(path={},hits={},misses={})'.format(
+            self.__class__.__name__,
+            self.path,
+            self.hits,
+            self.misses
+        )
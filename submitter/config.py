@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+from .archive import CODECS
+from .metrics import FORMATS as METRICS_FORMATS
+
 class Config:
     """
     Load configuration values from the environment.
@@ -13,10 +16,39 @@ class Config:
         self.content_service_url = env.get('CONTENT_SERVICE_URL')
         self.content_service_apikey = env.get('CONTENT_SERVICE_APIKEY')
         self.content_id_base = env.get('CONTENT_ID_BASE')
-        try:
-            self.asset_batch_size = int(env.get('ASSET_BATCH_SIZE', '30000000'))
-        except ValueError:
-            self.problems.append('ASSET_BATCH_SIZE must be an integer')
+        self.asset_batch_size = self._integer(env, 'ASSET_BATCH_SIZE', 30000000)
+        self.asset_streaming = env.get('ASSET_STREAMING', '') != ''
+        self.asset_include = self._patterns(env, 'ASSET_INCLUDE')
+        self.asset_exclude = self._patterns(env, 'ASSET_EXCLUDE')
+        self.asset_compression = env.get('ASSET_COMPRESSION', 'gzip')
+        if self.asset_compression not in CODECS:
+            self.problems.append('ASSET_COMPRESSION must be one of: {}'.format(', '.join(CODECS)))
+        self.asset_compression_level = self._integer(
+            env, 'ASSET_COMPRESSION_LEVEL', 9, minimum=0, maximum=9
+        )
+        self.upload_workers = self._integer(env, 'ASSET_UPLOAD_WORKERS', 1, minimum=1)
+        self.hash_workers = self._integer(env, 'ASSET_HASH_WORKERS', 1, minimum=1)
+        self.envelope_workers = self._integer(env, 'ENVELOPE_WORKERS', 1, minimum=1)
+        self.envelope_streaming = env.get('ENVELOPE_STREAMING', '') != ''
+        self.envelope_batch_size = self._integer(env, 'ENVELOPE_BATCH_SIZE', 0, minimum=0)
+        self.fingerprint_cache = env.get('SUBMITTER_FINGERPRINT_CACHE') or None
+        self.pool_size = self._integer(env, 'CONTENT_SERVICE_POOL_SIZE', 10, minimum=1)
+        self.connect_timeout = self._seconds(env, 'CONTENT_SERVICE_CONNECT_TIMEOUT', 30)
+        self.read_timeout = self._seconds(env, 'CONTENT_SERVICE_READ_TIMEOUT', None)
+        self.retries = self._integer(env, 'CONTENT_SERVICE_RETRIES', 3, minimum=0)
+        self.check_shard_size = self._integer(env, 'CONTENT_SERVICE_CHECK_SHARD_SIZE', 0, minimum=0)
+        self.check_workers = self._integer(env, 'CONTENT_SERVICE_CHECK_WORKERS', 4, minimum=1)
+        self.manifest = env.get('SUBMITTER_MANIFEST') or None
+        self.force_full = env.get('SUBMITTER_FORCE_FULL', '') != ''
+        self.metrics_file = env.get('SUBMITTER_METRICS_FILE') or None
+        self.metrics_format = env.get('SUBMITTER_METRICS_FORMAT', 'json')
+        if self.metrics_format not in METRICS_FORMATS:
+            self.problems.append('SUBMITTER_METRICS_FORMAT must be one of: {}'.format(', '.join(METRICS_FORMATS)))
+        self.jobs = env.get('SUBMITTER_JOBS') or None
+        self.jobs_concurrency = self._integer(env, 'SUBMITTER_JOBS_CONCURRENCY', 4, minimum=1)
+        self.watch = env.get('SUBMITTER_WATCH', '') != ''
+        self.watch_interval = self._seconds(env, 'SUBMITTER_WATCH_INTERVAL', 1.0)
+        self.watch_debounce = self._seconds(env, 'SUBMITTER_WATCH_DEBOUNCE', 0.25)
         self.verbose = env.get('VERBOSE', '') != ''
 
         if self.content_service_url and self.content_service_url.endswith('/'):
@@ -25,6 +57,58 @@ class Config:
         if self.content_id_base and not self.content_id_base.endswith('/'):
             self.content_id_base += '/'
 
+    def _integer(self, env, name, default, minimum=None, maximum=None):
+        """
+        Parse an optional integer setting, recording a problem if it's invalid.
+        """
+
+        try:
+            value = int(env.get(name, str(default)))
+        except ValueError:
+            self.problems.append('{} must be an integer'.format(name))
+            return None
+
+        if minimum is not None and value < minimum:
+            self.problems.append('{} must be at least {}'.format(name, minimum))
+            return None
+
+        if maximum is not None and value > maximum:
+            self.problems.append('{} must be at most {}'.format(name, maximum))
+            return None
+
+        return value
+
+    def _patterns(self, env, name):
+        """
+        Parse an optional comma-separated list of glob patterns.
+        """
+
+        return tuple(p.strip() for p in env.get(name, '').split(',') if p.strip())
+
+    def _seconds(self, env, name, default):
+        """
+        Parse an optional duration in seconds, recording a problem if it's
+        invalid. An empty value means no limit.
+        """
+
+        raw = env.get(name)
+        if raw is None:
+            return default
+        if raw == '':
+            return None
+
+        try:
+            value = float(raw)
+        except ValueError:
+            self.problems.append('{} must be a number of seconds'.format(name))
+            return None
+
+        if value <= 0:
+            self.problems.append('{} must be positive'.format(name))
+            return None
+
+        return value
+
     def missing(self):
         m = []
         if not self.envelope_dir:
@@ -1,29 +1,77 @@
 # -*- coding: utf-8 -*-
 
+import functools
 import logging
+import random
+import threading
+import time
 from datetime import datetime
 
 from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+
+# Default number of connections kept alive to the content service.
+DEFAULT_POOL_SIZE = 10
+
+# Default number of times a failed request is retried.
+DEFAULT_RETRIES = 3
+
+# Default delay before the first retry, in seconds. Each subsequent retry waits
+# up to twice as long, to at most MAX_BACKOFF.
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 30
+
+# Default number of check query shards sent at once.
+DEFAULT_CHECK_WORKERS = 4
+
+# Response statuses that indicate a transient failure worth retrying.
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
 
 class ContentService():
     """
     Perform operations with the content service API.
 
     https://github.com/deconst/content-service#api
+
+    Requests that fail with a connection error, a timeout, or a gateway or
+    availability error status are retried up to "retries" times, with
+    exponential backoff and full jitter. Each retry is counted in "retries_made".
+
+    If "shard_size" is set, check queries with more entries than that are split
+    into shards of at most "shard_size" entries, which are sent concurrently by
+    up to "check_workers" threads and whose responses are merged.
     """
 
-    def __init__(self, url, apikey, session=None):
+    def __init__(self, url, apikey, session=None, pool_size=DEFAULT_POOL_SIZE,
+                 timeout=None, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 shard_size=0, check_workers=DEFAULT_CHECK_WORKERS):
         self.base_url = url
+        self.shard_size = shard_size
+        self.check_workers = check_workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.retries_made = 0
+        self.lock = threading.Lock()
 
         self.session = session
         if not self.session:
             self.session = Session()
 
-        self.session.headers.update({
+            # Keep up to "pool_size" connections to the content service alive
+            # for reuse by concurrent uploads.
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+
+        # Sent with each request rather than set on the session, which may be
+        # shared with ContentServices that use other API keys.
+        self.headers = {
             'Accept': 'application/json',
             'User-Agent': 'submitter/0.0.0',
             'Authorization': 'deconst {}'.format(apikey)
-        })
+        }
 
     def checkassets(self, query):
         """
@@ -33,35 +81,22 @@ class ContentService():
         https://github.com/deconst/content-service#get-checkassets
         """
 
-        logging.debug('Beginning /checkassets request.')
-        start = datetime.utcnow()
-        u = self.base_url + '/checkassets'
-        r = self.session.get(u, json=query, headers={
-            'Content-Type': 'application/json'
-        })
-        r.raise_for_status()
-        finish = datetime.utcnow()
-        logging.debug('Completed /checkassets request in {}.'.format(finish - start))
-        return r.json()
+        return self._check('/checkassets', query)
 
     def bulkasset(self, tarball):
         """
         Bulk-upload a binary buffer containing multiple assets within a
-        .tar.gz file.
+        .tar.gz file. "tarball" may also be a file-like object, an iterable of
+        chunks to be sent with chunked transfer encoding, or a callable that
+        returns any of these. Only buffers, seekable file objects, and
+        callables can be sent again if the upload must be retried.
 
         https://github.com/deconst/content-service#post-bulkasset
         """
 
-        logging.debug('Beginning /bulkasset request.')
-        start = datetime.utcnow()
-        u = self.base_url + '/bulkasset'
-        r = self.session.post(u, data=tarball, headers={
+        return self._request('POST', '/bulkasset', data=tarball, headers={
             'Content-Type': 'application/tar+gzip'
         })
-        r.raise_for_status()
-        finish = datetime.utcnow()
-        logging.debug('Completed /bulkasset request in {}.'.format(finish - start))
-        return r.json()
 
     def checkcontent(self, query):
         """
@@ -71,32 +106,105 @@ class ContentService():
         https://github.com/deconst/content-service#get-checkcontent
         """
 
-        logging.debug('Beginning /checkcontent request.')
-        start = datetime.utcnow()
-        u = self.base_url + '/checkcontent'
-        r = self.session.get(u, json=query, headers={
-            'Content-Type': 'application/json'
-        })
-        r.raise_for_status()
-        finish = datetime.utcnow()
-        logging.debug('Completed /bulkasset request in {}.'.format(finish - start))
-        return r.json()
+        return self._check('/checkcontent', query)
 
     def bulkcontent(self, tarball):
         """
         Bulk-upload a binary buffer containing multiple envelopes and
-        metadata files within a .tar.gz file.
+        metadata files within a .tar.gz file. "tarball" may be any of the
+        types accepted by bulkasset.
 
         https://github.com/deconst/content-service#post-bulkcontent
         """
 
-        logging.debug('Beginning /bulkcontent request.')
-        start = datetime.utcnow()
-        u = self.base_url + '/bulkcontent'
-        r = self.session.post(u, data=tarball, headers={
+        return self._request('POST', '/bulkcontent', data=tarball, headers={
             'Content-Type': 'application/tar+gzip'
         })
-        r.raise_for_status()
-        finish = datetime.utcnow()
-        logging.debug('Completed /bulkasset request in {}.'.format(finish - start))
-        return r.json()
+
+    def _check(self, path, query):
+        """
+        Perform a check query, split into concurrent shards if it's too large.
+        """
+
+        if not self.shard_size or len(query) <= self.shard_size:
+            return self._check_shard(path, query)
+
+        items = list(query.items())
+        shards = [
+            dict(items[i:i + self.shard_size])
+            for i in range(0, len(items), self.shard_size)
+        ]
+        logging.debug('Splitting {} query of {} entries into {} shards.'.format(path, len(query), len(shards)))
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        response = {}
+        with ThreadPoolExecutor(max_workers=self.check_workers) as executor:
+            for shard_response in executor.map(functools.partial(self._check_shard, path), shards):
+                response.update(shard_response)
+        return response
+
+    def _check_shard(self, path, query):
+        return self._request('GET', path, json=query, headers={
+            'Content-Type': 'application/json'
+        })
+
+    def _request(self, method, path, data=None, headers=None, **kwargs):
+        """
+        Perform a request against the content service, retrying it if it fails
+        in a way that's likely to be transient. Return the decoded JSON response.
+        """
+
+        u = self.base_url + path
+        headers = dict(self.headers, **(headers or {}))
+        attempt = 0
+        while True:
+            attempt += 1
+            body = data() if callable(data) else data
+            if hasattr(body, 'seek'):
+                body.seek(0)
+            can_retry = attempt <= self.retries and _replayable(data)
+
+            logging.debug('Beginning {} request.'.format(path))
+            start = datetime.utcnow()
+            try:
+                r = self.session.request(method, u, data=body, headers=headers, timeout=self.timeout, **kwargs)
+                if r.status_code not in RETRY_STATUSES or not can_retry:
+                    r.raise_for_status()
+                    finish = datetime.utcnow()
+                    logging.debug('Completed {} request in {}.'.format(path, finish - start))
+                    return r.json()
+                problem = 'HTTP {}'.format(r.status_code)
+            except (RequestsConnectionError, Timeout) as e:
+                if not can_retry:
+                    raise
+                problem = e.__class__.__name__
+
+            with self.lock:
+                self.retries_made += 1
+
+            delay = random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** (attempt - 1)))
+            logging.warning('{} request failed with {}. Retrying in {:.1f}s ({} of {}).'.format(
+                path, problem, delay, attempt, self.retries
+            ))
+            time.sleep(delay)
+
+def shared_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+    Construct a Session with a connection pool that several ContentServices,
+    or successive submits, may share.
+    """
+
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def _replayable(data):
+    """
+    Return True if a request body can be sent again.
+    """
+
+    return data is None or callable(data) or hasattr(data, 'seek') or \
+        isinstance(data, (bytes, bytearray, str, dict))
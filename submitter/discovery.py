@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+from fnmatch import fnmatchcase
+
+class FileEntry():
+    """
+    A file discovered beneath a directory, with the stat() result gathered
+    while scanning it.
+    """
+
+    __slots__ = ('localpath', 'fullpath', 'stat')
+
+    def __init__(self, localpath, fullpath, stat):
+        self.localpath = localpath
+        self.fullpath = fullpath
+        self.stat = stat
+
+    @property
+    def size(self):
+        return self.stat.st_size
+
+    @property
+    def mtime_ns(self):
+        return self.stat.st_mtime_ns
+
+    def __repr__(self):
+        return '{}(localpath={},size={})'.format(
+            self.__class__.__name__,
+            self.localpath,
+            self.size
+        )
+
+def matches(localpath, name, patterns):
+    """
+    Return True if a file or directory matches any of the glob "patterns".
+    Patterns that contain a slash are matched against the whole path relative
+    to the scanned directory; others are matched against the name alone.
+    """
+
+    for pattern in patterns:
+        if fnmatchcase(localpath if '/' in pattern else name, pattern):
+            return True
+    return False
+
+def scan_files(directory, include=(), exclude=()):
+    """
+    Recursively generate a FileEntry for each regular file beneath
+    "directory", in the same order as os.walk. Relative paths use forward
+    slashes.
+
+    If "include" patterns are given, only files that match one of them are
+    generated. Files and directories that match an "exclude" pattern are
+    skipped entirely. Symbolic links to files are followed; symbolic links to
+    directories are not.
+    """
+
+    yield from _scan(directory, '', include, exclude)
+
+def _scan(path, prefix, include, exclude):
+    try:
+        # os.scandir() is only a context manager from Python 3.6; reading the
+        # iterator to the end closes it.
+        entries = list(os.scandir(path))
+    except OSError as e:
+        logging.warning('Unable to scan directory {}: {}'.format(path, e))
+        return
+
+    subdirectories = []
+    for entry in entries:
+        localpath = prefix + entry.name
+        if exclude and matches(localpath, entry.name, exclude):
+            continue
+
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append((entry.path, localpath))
+                continue
+            if not entry.is_file():
+                continue
+            if include and not matches(localpath, entry.name, include):
+                continue
+
+            yield FileEntry(localpath, entry.path, entry.stat())
+        except OSError as e:
+            # The file vanished or became unreadable while scanning.
+            logging.warning('Unable to stat {}: {}'.format(entry.path, e))
+
+    for fullpath, localpath in subdirectories:
+        yield from _scan(fullpath, localpath + '/', include, exclude)
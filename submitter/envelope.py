@@ -2,18 +2,86 @@
 
 import hashlib
 import json
+import logging
+import os
 from os.path import basename, splitext
 from urllib.parse import unquote
 
 class Envelope():
     """
     A metadata envelope, read from disk.
+
+    Like Assets, Envelopes are slotted and keep their fingerprint as a raw
+    SHA256 digest.
     """
 
-    def __init__(self, fname, stream):
+    __slots__ = ('fname', 'upload_needed', '_document', '_encoded', '_digest')
+
+    def __init__(self, fname, stream=None, fingerprint=None):
+        """
+        Parse the envelope's document from "stream". An envelope that was
+        already processed elsewhere may instead be constructed with only its
+        "fingerprint"; its document is then read again by load() if needed.
+        """
+
         self.fname = fname
-        self.document = json.load(stream)
+        self._document = None
+        self._encoded = None
+        if stream is not None:
+            self._document = json.load(stream)
         self.upload_needed = True
+        self._digest = None
+        if fingerprint is not None:
+            self.reuse_fingerprint(fingerprint)
+
+    @property
+    def document(self):
+        """
+        The parsed JSON document. Once this envelope has been encoded, only the
+        encoded bytes are retained and the document is parsed from them again
+        on access.
+        """
+
+        if self._document is None and self._encoded is not None:
+            return json.loads(self._encoded.decode('utf-8'))
+        return self._document
+
+    def load(self, asset_set):
+        """
+        Read this envelope's document from disk and apply its asset offsets, if
+        neither its document nor its encoded form is held in memory.
+        """
+
+        if self._document is not None or self._encoded is not None:
+            return
+
+        with open(self.fname, 'r') as ef:
+            self._document = json.load(ef)
+
+        # The document is the same one whose fingerprint may already be known,
+        # so keep that fingerprint rather than letting the offsets clear it.
+        digest = self._digest
+        self.apply_asset_offsets(asset_set)
+        self._digest = digest
+
+    def release(self):
+        """
+        Discard this envelope's document and encoded form. load() will read it
+        from disk again if it's needed. Its fingerprint is kept.
+        """
+
+        self._document = None
+        self._encoded = None
+
+    def encoded_size(self):
+        """
+        Return the size of this envelope's encoded form if it's held in memory,
+        or otherwise the size of its file on disk, which is a close estimate.
+        """
+
+        if self._encoded is not None:
+            return len(self._encoded)
+        return os.stat(self.fname).st_size
 
     def needs_upload(self):
         """
@@ -32,37 +100,90 @@ class Envelope():
         """
         If this envelope has an "asset_offsets" attribute, replace each
         placeholder character with the asset URL and remove that attribute.
+
+        Offsets claimed by more than one asset, or that fall outside of the
+        body, are reported as warnings. A colliding offset is given to the last
+        asset that claims it; an out-of-range offset is skipped.
         """
 
-        if 'asset_offsets' not in self.document:
+        if self._document is None or 'asset_offsets' not in self._document:
             return
 
+        body = self._document['body']
+        asset_offsets = self._document['asset_offsets']
+
+        urls_by_offset = {}
+        claimed = 0
+        for localpath, offsets in asset_offsets.items():
+            urls_by_offset.update(dict.fromkeys(offsets, asset_set[localpath].public_url))
+            claimed += len(offsets)
+
+        if claimed != len(urls_by_offset):
+            self._warn_offset_collisions(asset_offsets)
+
+        ordered = sorted(urls_by_offset.items())
+        if ordered and (ordered[0][0] < 0 or ordered[-1][0] >= len(body)):
+            ordered = self._discard_offsets_out_of_range(ordered, asset_offsets, len(body))
+
+        # Collect slices of the body and asset URLs, then join them once.
+        pieces = []
+        append = pieces.append
+        last = 0
+        for offset, url in ordered:
+            # The slice from the end of the last placeholder to just before
+            # this one, then the asset URL in place of the placeholder.
+            append(body[last:offset])
+            append(url)
+            last = offset + 1
+
+        # The rest of the body.
+        append(body[last:])
+
+        self._document['body'] = ''.join(pieces)
+        del self._document['asset_offsets']
+        self._encoded = None
+        self._digest = None
+
+    def _warn_offset_collisions(self, asset_offsets):
         paths_by_offset = {}
-        for localpath, offsets in self.document['asset_offsets'].items():
+        for localpath, offsets in asset_offsets.items():
             for offset in offsets:
-                # TODO warn if there are offset collisions
-                paths_by_offset[offset] = localpath
+                paths_by_offset.setdefault(offset, []).append(localpath)
 
-        body = self.document['body']
-        processed = ''
-        last = 0
-        for offset in sorted(paths_by_offset.keys()):
-            # Append the slice from the end of the last slice to just before
-            # this placeholder.
-            processed += body[last:offset]
+        for offset, localpaths in sorted(paths_by_offset.items()):
+            if len(localpaths) > 1:
+                logging.warning('Envelope {}: offset {} is claimed more than once, by {}.'.format(
+                    self.content_id(), offset, ', '.join(localpaths)
+                ))
+
+    def _discard_offsets_out_of_range(self, ordered, asset_offsets, length):
+        for localpath, offsets in asset_offsets.items():
+            for offset in offsets:
+                if offset < 0 or offset >= length:
+                    logging.warning('Envelope {}: offset {} for asset {} is outside of its {}-character body.'.format(
+                        self.content_id(), offset, localpath, length
+                    ))
 
-            # Insert the asset URL.
-            asset = asset_set[paths_by_offset[offset]]
-            processed += asset.public_url
+        return [(offset, url) for offset, url in ordered if 0 <= offset < length]
 
-            # Mark the last occurrence.
-            last = offset + 1
+    def asset_paths(self):
+        """
+        Return the sorted local paths of the assets that this envelope's asset
+        offsets refer to. Must be called before apply_asset_offsets.
+        """
 
-        # Append the rest of the body.
-        processed += body[last:]
+        if self._document is None or 'asset_offsets' not in self._document:
+            return []
+        return sorted(self._document['asset_offsets'])
+
+    def asset_context(self, asset_set):
+        """
+        Return a digest of the asset public URLs that this envelope's fingerprint
+        depends on, or an empty string if it has no asset offsets. Must be called
+        before apply_asset_offsets.
+        """
 
-        self.document['body'] = processed
-        del self.document['asset_offsets']
+        return asset_context(self.asset_paths(), asset_set)
 
     def accept_presence(self, response):
         """
@@ -76,10 +197,36 @@ class Envelope():
         Compute the SHA256 checksum of a stable representation of this envelope.
         """
 
-        return hashlib.sha256(self.serialize().encode('utf-8')).hexdigest()
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.encode()).digest()
+        return self._digest.hex()
+
+    def reuse_fingerprint(self, fingerprint):
+        """
+        Accept a previously computed fingerprint for this envelope's current
+        document, rather than serializing and hashing it again.
+        """
+
+        self._digest = bytes.fromhex(fingerprint)
+
+    def encode(self):
+        """
+        Return the stable serialized representation of this envelope as UTF-8
+        bytes. The bytes are computed once and shared by the fingerprint and
+        the upload tarball. Once asset offsets have been applied, the parsed
+        document is discarded in favor of them.
+        """
+
+        if self._encoded is None:
+            self._encoded = self.serialize().encode('utf-8')
+            if 'asset_offsets' not in self._document:
+                self._document = None
+        return self._encoded
 
     def serialize(self):
-        return json.dumps(self.document, separators=(',', ':'), sort_keys=True, ensure_ascii=False)
+        if self._document is None and self._encoded is not None:
+            return self._encoded.decode('utf-8')
+        return json.dumps(self._document, separators=(',', ':'), sort_keys=True, ensure_ascii=False)
 
     def __repr__(self):
         return '{}(fname={},document={},upload_needed={})'.format(
@@ -101,6 +248,20 @@ class Envelope():
         )
 
 
+def asset_context(localpaths, asset_set):
+    """
+    Return a digest of the public URLs of the assets at the sorted "localpaths",
+    or an empty string if there are none. This lets a cached envelope
+    fingerprint be checked without reading the envelope again.
+    """
+
+    if not localpaths:
+        return ''
+
+    urls = [[localpath, asset_set[localpath].public_url] for localpath in localpaths]
+    return hashlib.sha256(json.dumps(urls).encode('utf-8')).hexdigest()
+
+
 class EnvelopeSet():
     """
     Collection of all metadata Envelopes discovered from disk.
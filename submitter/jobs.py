@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from os.path import splitext
+
+from .config import Config
+from .content_service import shared_session
+from .submit import submit_async, SUCCESS, NOOP, FAILURE
+
+# Settings naming a file that holds the state of a single submit. A job that
+# inherits one of these from the environment gets a file of its own.
+PER_JOB_FILES = ('SUBMITTER_FINGERPRINT_CACHE', 'SUBMITTER_MANIFEST', 'SUBMITTER_METRICS_FILE')
+
+def load_jobs(path):
+    """
+    Read a jobs manifest: a JSON list of objects, each of which holds the
+    settings of one submit, such as its ENVELOPE_DIR, ASSET_DIR, and
+    CONTENT_ID_BASE. Settings that a job doesn't give are taken from the
+    environment.
+    """
+
+    with open(path, 'r') as jf:
+        jobs = json.load(jf)
+
+    if not isinstance(jobs, list) or not all(isinstance(job, dict) for job in jobs):
+        raise ValueError('{} must contain a list of job objects'.format(path))
+    return jobs
+
+def job_configs(env, jobs):
+    """
+    Construct the Config of each job from the environment "env" and the job's
+    own settings.
+    """
+
+    configs = []
+    for job in jobs:
+        job_env = dict(env)
+        job_env.update({name: str(value) for name, value in job.items()})
+
+        # Keep jobs from sharing state files that they would overwrite.
+        for name in PER_JOB_FILES:
+            if name not in job and job_env.get(name):
+                job_env[name] = _per_job_path(job_env[name], job_env.get('CONTENT_ID_BASE', ''))
+
+        configs.append(Config(job_env))
+    return configs
+
+def _per_job_path(path, content_id_base):
+    digest = hashlib.sha256(content_id_base.encode('utf-8')).hexdigest()[:12]
+    root, ext = splitext(path)
+    return '{}-{}{}'.format(root, digest, ext)
+
+async def submit_jobs(configs, session=None, concurrency=4, executor=None):
+    """
+    Submit each job in "configs", up to "concurrency" at once, sharing one
+    Session and one executor. Return a JobResult for each, in order. A job that
+    raises an exception is reported as failed without affecting the others.
+    """
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(n, config):
+        async with slots:
+            logging.info('Starting job {} of {}: {}'.format(n, len(configs), config.content_id_base))
+            try:
+                result = await submit_async(config, session, executor)
+            except Exception as e:
+                logging.error('Job {} ({}) failed: {}'.format(n, config.content_id_base, e))
+                return JobResult(config, error=e)
+
+            logging.info('Finished job {} ({}): {}.'.format(n, config.content_id_base, result.state))
+            return JobResult(config, result=result)
+
+    return await asyncio.gather(*[run(n, config) for n, config in enumerate(configs, 1)])
+
+def run_jobs(configs, concurrency=4, workers=None, pool_size=10):
+    """
+    Submit each job in "configs" from a single event loop. Blocking work from
+    every job runs on one pool of "workers" threads. Return a JobResult for
+    each job.
+    """
+
+    session = shared_session(pool_size)
+
+    # asyncio.run() is new in Python 3.7. Set the loop as the current one so
+    # that get_event_loop() finds it on earlier versions.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return loop.run_until_complete(submit_jobs(configs, session, concurrency, executor))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+def aggregate_state(job_results):
+    """
+    Summarize the results of several jobs: FAILURE if any job failed, NOOP if
+    every job did nothing, and otherwise SUCCESS.
+    """
+
+    states = [job_result.state for job_result in job_results]
+    if FAILURE in states:
+        return FAILURE
+    if all(state is NOOP for state in states):
+        return NOOP
+    return SUCCESS
+
+class JobResult():
+    """
+    The outcome of one job: its SubmitResult, or the exception that stopped it.
+    """
+
+    def __init__(self, config, result=None, error=None):
+        self.config = config
+        self.result = result
+        self.error = error
+
+    @property
+    def state(self):
+        if self.result is None:
+            return FAILURE
+        return self.result.state
+
+    def __repr__(self):
+        return '{}(content_id_base={},state={})'.format(
+            self.__class__.__name__,
+            self.config.content_id_base,
+            self.state
+        )
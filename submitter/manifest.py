@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+
+# Incremented whenever the manifest format changes incompatibly.
+VERSION = 1
+
+class Manifest():
+    """
+    A record of the assets and envelopes that were present on the content
+    service after the last successful submit, stored as a JSON file. Assets
+    and envelopes whose fingerprints are unchanged since then don't need to
+    be checked with the content service again.
+
+    A manifest only applies to the content service and content ID base it was
+    recorded against; if either differs, it's treated as empty.
+
+    If "path" is None, the manifest is kept in memory only.
+    """
+
+    def __init__(self, path, content_service_url, content_id_base):
+        self.path = path
+        self.content_service_url = content_service_url
+        self.content_id_base = content_id_base
+
+        # localpath -> [fingerprint, public_url]
+        self.assets = {}
+
+        # content ID -> fingerprint
+        self.envelopes = {}
+
+        # True once the manifest holds the state of a successful submit.
+        self.recorded = False
+
+    def load(self):
+        """
+        Read the manifest from disk, if it exists and matches this target.
+        """
+
+        if self.path is None:
+            return
+
+        try:
+            with open(self.path, 'r') as mf:
+                doc = json.load(mf)
+        except FileNotFoundError:
+            logging.debug('No manifest found at {}.'.format(self.path))
+            return
+        except ValueError:
+            logging.warning('Ignoring unreadable manifest {}.'.format(self.path))
+            return
+
+        target = (doc.get('version'), doc.get('contentServiceURL'), doc.get('contentIDBase'))
+        if target != (VERSION, self.content_service_url, self.content_id_base):
+            logging.info('Ignoring manifest {} recorded for a different target.'.format(self.path))
+            return
+
+        self.assets = doc.get('assets', {})
+        self.envelopes = doc.get('envelopes', {})
+        self.recorded = True
+        logging.debug('Loaded manifest of {} assets and {} envelopes from {}.'.format(
+            len(self.assets), len(self.envelopes), self.path
+        ))
+
+    def known_url(self, localpath, fingerprint):
+        """
+        Return the public URL recorded for the asset at "localpath" if its
+        fingerprint is unchanged, or None.
+        """
+
+        entry = self.assets.get(localpath)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+        return None
+
+    def known_present(self, content_id, fingerprint):
+        """
+        Return True if the envelope with "content_id" was recorded as present
+        with the same fingerprint.
+        """
+
+        return self.envelopes.get(content_id) == fingerprint
+
+    def same_envelopes(self, content_ids):
+        """
+        Return True if the last successful submit left exactly the envelopes
+        with "content_ids" on the content service, so that a submit that
+        uploads none of them has nothing to delete either.
+        """
+
+        return self.recorded and self.envelopes.keys() == set(content_ids)
+
+    def record(self, asset_set, envelope_set):
+        """
+        Replace the manifest's contents with the state of a successful submit.
+        """
+
+        self.assets = {
+            a.localpath: [a.fingerprint, a.public_url]
+            for a in asset_set.all() if a.public_url is not None
+        }
+        self.envelopes = {e.content_id(): e.fingerprint() for e in envelope_set.all()}
+        self.recorded = True
+
+    def save(self):
+        """
+        Write the manifest to disk, replacing any previous version atomically.
+        """
+
+        if self.path is None:
+            return
+
+        doc = {
+            'version': VERSION,
+            'contentServiceURL': self.content_service_url,
+            'contentIDBase': self.content_id_base,
+            'assets': self.assets,
+            'envelopes': self.envelopes
+        }
+
+        partial = self.path + '.partial'
+        with open(partial, 'w') as mf:
+            json.dump(doc, mf, separators=(',', ':'), sort_keys=True)
+        os.replace(partial, self.path)
+
+        logging.debug('Saved manifest of {} assets and {} envelopes to {}.'.format(
+            len(self.assets), len(self.envelopes), self.path
+        ))
+
+    def __repr__(self):
+        return '{}(path={},assets x{},envelopes x{})'.format(
+            self.__class__.__name__,
+            self.path,
+            len(self.assets),
+            len(self.envelopes)
+        )
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import json
+import os
+import threading
+import sys
+import time
+
+# Formats in which metrics may be written.
+FORMATS = ('json', 'prometheus')
+
+# Prefix of each metric name in the Prometheus text format.
+PROMETHEUS_PREFIX = 'submitter'
+
+class Phase():
+    """
+    Accumulated measurements of one phase of a submit. A phase may be entered
+    many times, possibly from several threads at once; its times are summed
+    across every call.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.items = 0
+        self.bytes = 0
+        self.peak_memory = 0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'seconds': self.seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'items': self.items,
+            'bytes': self.bytes,
+            'peak_memory': self.peak_memory
+        }
+
+    def __repr__(self):
+        return '{}(calls={},seconds={:.3f},cpu_seconds={:.3f},items={},bytes={},peak_memory={})'.format(
+            self.__class__.__name__,
+            self.calls,
+            self.seconds,
+            self.cpu_seconds,
+            self.items,
+            self.bytes,
+            self.peak_memory
+        )
+
+class Measurement():
+    """
+    The items and bytes processed by a single call of a phase, filled in by
+    the code being measured.
+    """
+
+    def __init__(self, items=0, nbytes=0):
+        self.items = items
+        self.bytes = nbytes
+        self.peak_memory = 0
+
+class Metrics():
+    """
+    Record the wall time, CPU time, item count, and byte count of each phase
+    of a submit, and write them out in a machine-readable format.
+
+    CPU time is that of the whole process while the phase ran, so it includes
+    work done by helper threads, as well as that of any phases that overlap it.
+    Work done within worker processes isn't counted.
+
+    While tracemalloc is tracing, the peak memory allocated by Python during
+    each phase is recorded too. Otherwise it's reported as 0.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+        # Measurements of the phases that are currently running.
+        self.running = []
+
+    @contextlib.contextmanager
+    def phase(self, name, items=0, nbytes=0):
+        """
+        Measure the enclosed block as one call of the phase "name". The
+        yielded Measurement's "items" and "bytes" may be updated within the
+        block once they're known.
+        """
+
+        measurement = Measurement(items, nbytes)
+        with self.lock:
+            self._sample_memory()
+            self.running.append(measurement)
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield measurement
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+            with self.lock:
+                self._sample_memory()
+                self.running.remove(measurement)
+
+                phase = self.phases.get(name)
+                if phase is None:
+                    phase = self.phases[name] = Phase()
+                phase.calls += 1
+                phase.seconds += wall
+                phase.cpu_seconds += cpu
+                phase.items += measurement.items
+                phase.bytes += measurement.bytes
+                phase.peak_memory = max(phase.peak_memory, measurement.peak_memory)
+
+    def _sample_memory(self):
+        """
+        Credit the peak traced memory since the last sample to each running
+        phase, then start a new sampling window.
+        """
+
+        # Memory is only traced if something else has imported and started
+        # tracemalloc, so don't pay to import it here.
+        tracemalloc = sys.modules.get('tracemalloc')
+        if tracemalloc is None or not tracemalloc.is_tracing():
+            return
+
+        current, peak = tracemalloc.get_traced_memory()
+
+        # Before Python 3.9 the peak can't be reset, so it would include every
+        # earlier phase. Credit the memory in use at each sample instead.
+        reset_peak = getattr(tracemalloc, 'reset_peak', None)
+        if reset_peak is None:
+            peak = current
+
+        for measurement in self.running:
+            measurement.peak_memory = max(measurement.peak_memory, peak)
+        if reset_peak is not None:
+            reset_peak()
+
+    def gauge(self, name, value):
+        """
+        Record a single value describing the submit as a whole.
+        """
+
+        with self.lock:
+            self.gauges[name] = value
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'phases': {name: phase.as_dict() for name, phase in self.phases.items()},
+                'gauges': dict(self.gauges)
+            }
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """
+        Render the metrics in the Prometheus text exposition format, suitable
+        for the node exporter's textfile collector or a Pushgateway.
+        """
+
+        doc = self.as_dict()
+        lines = []
+
+        for field, help_text in (
+            ('calls', 'Number of times each submit phase ran.'),
+            ('seconds', 'Wall time spent in each submit phase.'),
+            ('cpu_seconds', 'Process CPU time spent in each submit phase.'),
+            ('items', 'Number of items processed by each submit phase.'),
+            ('bytes', 'Number of bytes processed by each submit phase.'),
+            ('peak_memory', 'Peak memory traced by tracemalloc during each submit phase.')
+        ):
+            metric = '{}_phase_{}'.format(PROMETHEUS_PREFIX, field)
+            lines.append('# HELP {} {}'.format(metric, help_text))
+            lines.append('# TYPE {} gauge'.format(metric))
+            for name in sorted(doc['phases']):
+                lines.append('{}{{phase="{}"}} {}'.format(metric, name, doc['phases'][name][field]))
+
+        for name in sorted(doc['gauges']):
+            metric = '{}_{}'.format(PROMETHEUS_PREFIX, name)
+            lines.append('# TYPE {} gauge'.format(metric))
+            lines.append('{} {}'.format(metric, doc['gauges'][name]))
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, fmt='json'):
+        """
+        Write the metrics to "path" in the format "fmt", replacing any previous
+        version atomically.
+        """
+
+        if fmt == 'prometheus':
+            text = self.to_prometheus()
+        else:
+            text = self.to_json()
+
+        partial = path + '.partial'
+        with open(partial, 'w') as mf:
+            mf.write(text)
+        os.replace(partial, path)
+
+    def __repr__(self):
+        return '{}(phases x{})'.format(self.__class__.__name__, len(self.phases))
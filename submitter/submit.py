@@ -1,92 +1,479 @@
 # -*- coding: utf-8 -*-
 
+import functools
 import io
+import itertools
 import json
 import os
-import tarfile
 import logging
 from datetime import datetime
 from os.path import join, relpath
 
 from .asset import Asset, AssetSet
-from .envelope import Envelope, EnvelopeSet
+from .envelope import Envelope, EnvelopeSet, asset_context
 from .content_service import ContentService
+from .manifest import Manifest
+from .archive import CompressionPolicy, open_tarball, stream_archive
+from .batch import BatchPlan
+from .discovery import scan_files
+from .metrics import Metrics
+
+# Modules that only some submits need, like asyncio, tarfile, sqlite3 and
+# concurrent.futures, are imported where they're used so that they don't slow
+# the start of every run.
 
 SUCCESS = 'success'
 NOOP = 'noop'
 FAILURE = 'failure'
 
-def submit(config, session=None):
+# Smallest number of envelopes sent to an envelope worker process at a time.
+ENVELOPE_CHUNKSIZE = 64
+
+# Number of chunks of envelopes that each envelope worker process receives, if
+# there are enough envelopes. Every chunk carries the asset public URLs along.
+ENVELOPE_CHUNKS_PER_WORKER = 4
+
+def submit(config, session=None, cache=None, manifest=None, asset_set=None, envelope_set=None):
     """
     Discover and upload assets, then discover, process, and upload envelopes.
+
+    A "cache" and "manifest" that outlive a single submit may be given in place
+    of those opened from "config", and so may an "asset_set" and an
+    "envelope_set" that are kept up to date with the files elsewhere.
     """
 
-    content_service = ContentService(
+    metrics = Metrics()
+    with metrics.phase('submit'):
+        content_service = content_service_for(config, session)
+        if cache is None:
+            cache = open_cache(config)
+        if manifest is None:
+            manifest = open_manifest(config)
+
+        asset_result = submit_assets(
+            config.asset_dir,
+            config.asset_batch_size,
+            content_service,
+            hash_workers=config.hash_workers,
+            cache=cache,
+            streaming=config.asset_streaming,
+            upload_workers=config.upload_workers,
+            compression=CompressionPolicy(config.asset_compression, config.asset_compression_level),
+            manifest=manifest,
+            metrics=metrics,
+            include=config.asset_include,
+            exclude=config.asset_exclude,
+            asset_set=asset_set
+        )
+        envelope_result = submit_envelopes(
+            config.envelope_dir,
+            asset_result.asset_set,
+            config.content_id_base,
+            content_service,
+            cache=cache,
+            envelope_workers=config.envelope_workers,
+            envelope_set=envelope_set,
+            manifest=manifest,
+            metrics=metrics,
+            streaming=config.envelope_streaming,
+            batch_size=config.envelope_batch_size
+        )
+
+        result = SubmitResult(
+            asset_result,
+            envelope_result,
+            _submit_state(envelope_result),
+            retries=content_service.retries_made,
+            metrics=metrics
+        )
+        _finish(result, cache, manifest)
+
+    _write_metrics(config, result)
+    return result
+
+async def submit_async(config, session=None, executor=None):
+    """
+    Asynchronous counterpart to submit(). Asset discovery and envelope parsing
+    run concurrently, and asset batches are uploaded concurrently up to the
+    configured number of upload workers. Blocking work runs on "executor", or
+    on the event loop's default executor. Several submissions may be awaited
+    together on one event loop.
+    """
+
+    import asyncio
+
+    loop = asyncio.get_event_loop()
+
+    def run(fn, *args, **kwargs):
+        return loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+    metrics = Metrics()
+    with metrics.phase('submit'):
+        content_service = content_service_for(config, session)
+
+        cache = open_cache(config)
+        manifest = open_manifest(config)
+
+        # Envelopes processed by a worker pool, streamed, or whose fingerprints
+        # may be cached are read later instead.
+        parsing = None
+        if config.envelope_workers == 1 and not config.envelope_streaming and cache is None:
+            parsing = run(parse_envelopes, config.envelope_dir, metrics)
+
+        asset_set = await run(
+            discover_assets,
+            config.asset_dir,
+            config.hash_workers,
+            cache,
+            metrics,
+            config.asset_include,
+            config.asset_exclude
+        )
+
+        await run(_check_assets, asset_set, content_service, manifest, metrics)
+
+        compression = CompressionPolicy(config.asset_compression, config.asset_compression_level)
+        slots = asyncio.Semaphore(config.upload_workers)
+
+        async def upload(n, batch):
+            async with slots:
+                return await run(
+                    _upload_asset_batch,
+                    content_service,
+                    config.asset_dir,
+                    n,
+                    batch,
+                    config.asset_streaming,
+                    compression,
+                    metrics
+                )
+
+        uploads = _AssetUploads(asset_set, config.asset_batch_size)
+        for planned in uploads.passes():
+            for completed in asyncio.as_completed([upload(n, batch) for n, batch in planned]):
+                asset_set.accept_urls(await completed)
+        asset_result = uploads.result()
+
+        envelope_set = None
+        if parsing is not None:
+            envelope_set = await parsing
+
+        envelope_result = await run(
+            submit_envelopes,
+            config.envelope_dir,
+            asset_set,
+            config.content_id_base,
+            content_service,
+            cache=cache,
+            envelope_workers=config.envelope_workers,
+            envelope_set=envelope_set,
+            manifest=manifest,
+            metrics=metrics,
+            streaming=config.envelope_streaming,
+            batch_size=config.envelope_batch_size
+        )
+
+        result = SubmitResult(
+            asset_result,
+            envelope_result,
+            _submit_state(envelope_result),
+            retries=content_service.retries_made,
+            metrics=metrics
+        )
+        await run(_finish, result, cache, manifest)
+
+    await run(_write_metrics, config, result)
+    return result
+
+def content_service_for(config, session=None):
+    """
+    Construct a ContentService with the transport settings from "config".
+    """
+
+    return ContentService(
         url=config.content_service_url,
         apikey=config.content_service_apikey,
-        session=session
+        session=session,
+        pool_size=config.pool_size,
+        timeout=(config.connect_timeout, config.read_timeout),
+        retries=config.retries,
+        shard_size=config.check_shard_size,
+        check_workers=config.check_workers
     )
 
-    asset_result = submit_assets(
-        config.asset_dir,
-        config.asset_batch_size,
-        content_service
-    )
-    envelope_result = submit_envelopes(
-        config.envelope_dir,
-        asset_result.asset_set,
-        config.content_id_base,
-        content_service
-    )
+def open_cache(config):
+    """
+    Load the fingerprint cache, if one is configured.
+    """
+
+    if not config.fingerprint_cache:
+        return None
+
+    from .cache import FingerprintCache
+    return FingerprintCache(config.fingerprint_cache)
+
+def open_manifest(config):
+    """
+    Load the manifest of the last successful submit, if one is configured.
+    When a full reconciliation is forced, the manifest starts empty, but is
+    still written after a successful submit.
+    """
+
+    if not config.manifest:
+        return None
+
+    manifest = Manifest(config.manifest, config.content_service_url, config.content_id_base)
+    if config.force_full:
+        logging.info('Performing a full reconciliation with the content service.')
+    else:
+        manifest.load()
+    return manifest
+
+def _finish(result, cache, manifest):
+    """
+    Persist the cache and, if the submit succeeded, the manifest.
+    """
+
+    if cache is not None:
+        logging.info('Fingerprint cache: {} hits, {} misses.'.format(cache.hits, cache.misses))
+        cache.save()
+
+    if manifest is not None and result.state is not FAILURE:
+        manifest.record(result.asset_result.asset_set, result.envelope_result.envelope_set)
+        manifest.save()
+
+def _write_metrics(config, result):
+    """
+    Record the overall results of a submit and write its metrics, if a metrics
+    file is configured.
+    """
+
+    metrics = result.metrics
+    metrics.gauge('assets', len(result.asset_result.asset_set))
+    metrics.gauge('assets_uploaded', result.asset_result.uploaded)
+    metrics.gauge('asset_batches', result.asset_result.batches)
+    metrics.gauge('assets_deduplicated', result.asset_result.deduplicated)
+    metrics.gauge('asset_bytes_saved', result.asset_result.bytes_saved)
+    metrics.gauge('envelopes', len(result.envelope_result.envelope_set))
+    metrics.gauge('envelopes_uploaded', result.envelope_result.uploaded)
+    metrics.gauge('envelopes_deleted', result.envelope_result.deleted)
+    metrics.gauge('envelopes_failed', result.envelope_result.failed)
+    metrics.gauge('retries', result.retries)
+
+    for name, phase in sorted(metrics.phases.items()):
+        logging.debug('Phase {}: {}'.format(name, phase))
+
+    if config.metrics_file:
+        metrics.write(config.metrics_file, config.metrics_format)
+        logging.debug('Wrote metrics to {}.'.format(config.metrics_file))
+
+def _asset_query(asset_set, manifest):
+    """
+    Construct the /checkassets query for "asset_set". Assets that the manifest
+    shows are unchanged since the last submit accept their recorded public URLs
+    and are left out of the query. Return None if there's nothing to ask.
+    """
+
+    if manifest is None:
+        return asset_set.fingerprint_query()
+
+    for asset in asset_set.all():
+        public_url = manifest.known_url(asset.localpath, asset.fingerprint)
+        if public_url is not None:
+            asset.accept_url({asset.localpath: public_url})
+
+    query = {a.localpath: a.fingerprint for a in asset_set.to_upload()}
+    logging.info('{} of {} assets are unchanged since the last submit.'.format(
+        len(asset_set) - len(query), len(asset_set)
+    ))
+    return query or None
+
+def _envelope_presence(query, content_service, manifest, metrics):
+    """
+    Determine which envelopes in the /checkcontent "query" are already present
+    on the content service. Envelopes that the manifest shows are unchanged
+    since the last submit are known to be present without asking.
+    """
+
+    if manifest is None:
+        with metrics.phase('check_content', items=len(query)):
+            return content_service.checkcontent(query)
+
+    total = len(query)
+
+    response = {}
+    for content_id, fingerprint in list(query.items()):
+        if manifest.known_present(content_id, fingerprint):
+            response[content_id] = True
+            del query[content_id]
+
+    logging.info('{} of {} envelopes are unchanged since the last submit.'.format(
+        len(response), total
+    ))
+
+    if query:
+        with metrics.phase('check_content', items=len(query)):
+            response.update(content_service.checkcontent(query))
+    return response
+
+def _submit_state(envelope_result):
+    """
+    Derive the overall state of a submission from its envelope results.
+    """
 
     if envelope_result.failed != 0:
-        state = FAILURE
+        return FAILURE
     elif envelope_result.uploaded == 0:
-        state = NOOP
+        return NOOP
     else:
-        state = SUCCESS
+        return SUCCESS
 
-    return SubmitResult(asset_result, envelope_result, state)
 
-
-def submit_assets(directory, batch_size, content_service):
+def submit_assets(directory, batch_size, content_service, hash_workers=1, cache=None,
+                  streaming=False, upload_workers=1, compression=None, manifest=None,
+                  metrics=None, include=(), exclude=(), asset_set=None):
     """
     Recursively discover each asset file beneath "directory". Check the
     content service API to determine which assets need to be uploaded.
     Construct a tarball containing those assets and upload them. Return the
     generated AssetSet.
+
+    When "streaming" is set, each tarball is uploaded with chunked transfer
+    encoding while it is still being written, instead of being built in memory
+    first. When "upload_workers" is greater than one, up to that many batches
+    are built and uploaded at once. "compression" is a CompressionPolicy that
+    chooses the gzip level of each tarball.
+
+    If a Manifest is given, assets that are unchanged since the last
+    successful submit are not checked with the content service. Each phase is
+    measured by "metrics", if given. "include" and "exclude" are glob patterns
+    that select which files are assets. An AssetSet that's already been
+    fingerprinted may be passed as "asset_set" instead of discovering one.
     """
 
-    asset_set = AssetSet()
+    if compression is None:
+        compression = CompressionPolicy()
+    if metrics is None:
+        metrics = Metrics()
 
-    logging.debug('Discovering and fingerprinting asset files within {}.'.format(directory))
-    for root, dirs, files in os.walk(directory):
-        for fname in files:
-            fullpath = join(root, fname)
-            localpath = relpath(fullpath, directory)
-            with open(fullpath, 'rb') as af:
-                asset = Asset(localpath, af)
-                asset_set.append(asset)
-    logging.info('Discovered {} asset files.'.format(len(asset_set)))
+    if asset_set is None:
+        asset_set = discover_assets(directory, hash_workers, cache, metrics, include, exclude)
 
-    check_result = content_service.checkassets(asset_set.fingerprint_query())
-    asset_set.accept_urls(check_result)
+    _check_assets(asset_set, content_service, manifest, metrics)
 
-    uploaded, batches = 0, 0
-    while not asset_set.all_public():
-        batches += 1
+    uploads = _AssetUploads(asset_set, batch_size)
+    for planned in uploads.passes():
+        if upload_workers > 1 and len(planned) > 1:
+            logging.debug('Uploading {} asset batches with {} workers.'.format(len(planned), upload_workers))
+            from concurrent.futures import ThreadPoolExecutor, as_completed
+
+            with ThreadPoolExecutor(max_workers=upload_workers) as executor:
+                futures = [
+                    executor.submit(
+                        _upload_asset_batch, content_service, directory, n, batch, streaming, compression, metrics
+                    )
+                    for n, batch in planned
+                ]
+
+                # Merge each response from this thread as its upload completes.
+                for future in as_completed(futures):
+                    asset_set.accept_urls(future.result())
+        else:
+            for n, batch in planned:
+                upload_result = _upload_asset_batch(
+                    content_service, directory, n, batch, streaming, compression, metrics
+                )
+                asset_set.accept_urls(upload_result)
+
+    return uploads.result()
+
+def _check_assets(asset_set, content_service, manifest, metrics):
+    """
+    Ask the content service which of the assets in "asset_set" it already
+    holds, and accept the public URLs of those it does.
+    """
+
+    query = _asset_query(asset_set, manifest)
+    if query is not None:
+        with metrics.phase('check_assets', items=len(query)):
+            check_result = content_service.checkassets(query)
+        asset_set.accept_urls(check_result)
+
+class _AssetUploads():
+    """
+    Plan the passes that upload each asset in an AssetSet that the content
+    service doesn't already hold, and count what they upload. Only the uploads
+    themselves are left to the caller.
+    """
+
+    def __init__(self, asset_set, batch_size):
+        self.asset_set = asset_set
+        self.batch_size = batch_size
+        self.deduplicated, self.bytes_saved = _duplicate_savings(asset_set)
+        self.uploaded = 0
+        self.batches = 0
+        self.batch_sizes = []
+
+    def passes(self):
+        """
+        Yield a list of (batch number, batch) pairs to upload for each pass,
+        until every asset has a public URL. Each pass must accept the URLs of
+        the batches it uploads before the next one is planned.
+        """
+
+        while not self.asset_set.all_public():
+            plan, planned = _plan_asset_uploads(self.asset_set, self.batch_size, self.batches, self.uploaded)
+            self.batches += len(plan)
+            self.uploaded += sum(len(batch) for batch in plan)
+            self.batch_sizes.extend(plan.sizes)
+            yield planned
+
+    def result(self):
+        """
+        Summarize the uploads as an AssetSubmitResult.
+        """
+
+        return AssetSubmitResult(
+            asset_set=self.asset_set,
+            uploaded=self.uploaded,
+            present=len(self.asset_set) - self.uploaded - self.deduplicated,
+            batches=self.batches,
+            batch_sizes=self.batch_sizes,
+            deduplicated=self.deduplicated,
+            bytes_saved=self.bytes_saved
+        )
+
+def _duplicate_savings(asset_set):
+    """
+    Count the assets that needn't be uploaded because a copy with the same name
+    and contents will be, and the bytes that this saves.
+    """
+
+    duplicates = asset_set.duplicate_uploads()
+    bytes_saved = sum(asset.size or 0 for asset in duplicates)
+    if duplicates:
+        logging.info('Skipping {} duplicate assets ({} bytes).'.format(len(duplicates), bytes_saved))
+    return len(duplicates), bytes_saved
+
+def _plan_asset_uploads(asset_set, batch_size, batches, uploaded):
+    """
+    Plan batches for each asset that still needs to be uploaded. "batches" and
+    "uploaded" count the batches and assets planned by earlier passes. Return
+    the BatchPlan and a list of (batch number, batch) pairs.
+    """
 
-        logging.debug('Creating asset tarball for batch {}.'.format(batches))
-        ts = datetime.utcnow()
-        asset_archive = io.BytesIO()
-        tf = tarfile.open(fileobj=asset_archive, mode='w:gz')
-        for asset in asset_set.to_upload():
-            fullpath = join(directory, asset.localpath)
-            entry = tf.gettarinfo(fullpath, arcname=asset.localpath)
+    plan = BatchPlan(asset_set.unique_uploads(), batch_size)
+    logging.debug('Planned {} asset batches of {} bytes.'.format(
+        len(plan),
+        ', '.join(str(size) for size in plan.sizes)
+    ))
 
-            with open(fullpath, 'rb') as af:
-                tf.addfile(entry, fileobj=af)
+    planned = []
+    for batch in plan:
+        batches += 1
+        planned.append((batches, batch))
 
+        for asset in batch:
             if uploaded < 10:
                 logging.debug('  {}'.format(asset.localpath))
 
@@ -95,27 +482,159 @@ def submit_assets(directory, batch_size, content_service):
 
             uploaded += 1
 
-            if tf.offset > batch_size:
-                break
-        tf.close()
-        logging.debug('Created {}-byte tarball containing {} assets for batch {} in {}.'.format(
-            tf.offset,
-            uploaded,
-            batches,
-            datetime.utcnow() - ts
-        ))
+    return plan, planned
 
-        upload_result = content_service.bulkasset(asset_archive.getvalue())
-        asset_set.accept_urls(upload_result)
+def _upload_asset_batch(content_service, directory, n, batch, streaming, compression, metrics):
+    """
+    Construct the tarball for a single batch of assets and upload it. Return
+    the content service's response.
 
-    return AssetSubmitResult(
-        asset_set=asset_set,
-        uploaded=uploaded,
-        present=len(asset_set) - uploaded,
-        batches=batches
-    )
+    A streamed tarball is built while it's uploaded, so both are measured as
+    the "asset_upload" phase. Otherwise, building and compressing the tarball
+    is measured separately as "asset_archive".
+    """
+
+    level = compression.level_for(batch)
+    logging.debug('Creating asset tarball for batch {} at compression level {}.'.format(n, level))
+    ts = datetime.utcnow()
+    nbytes = sum(asset.size for asset in batch)
+
+    if streaming:
+        def build(fileobj):
+            tf = open_tarball(fileobj, level)
+            _write_asset_batch(tf, directory, batch)
+            tf.close()
 
-def submit_envelopes(directory, asset_set, content_id_base, content_service):
+        # Pass a factory so that the archive can be regenerated for a retry.
+        with metrics.phase('asset_upload', items=len(batch), nbytes=nbytes):
+            upload_result = content_service.bulkasset(lambda: stream_archive(build))
+    else:
+        with metrics.phase('asset_archive', items=len(batch), nbytes=nbytes):
+            asset_archive = io.BytesIO()
+            tf = open_tarball(asset_archive, level)
+            _write_asset_batch(tf, directory, batch)
+            tf.close()
+
+        # Upload the buffer directly rather than copying it with getvalue().
+        asset_archive.seek(0)
+        with metrics.phase('asset_upload', items=len(batch), nbytes=asset_archive.getbuffer().nbytes):
+            upload_result = content_service.bulkasset(asset_archive)
+
+    logging.debug('Uploaded tarball containing {} assets for batch {} in {}.'.format(
+        len(batch),
+        n,
+        datetime.utcnow() - ts
+    ))
+    return upload_result
+
+def _write_asset_batch(tf, directory, batch):
+    """
+    Add each asset in "batch" to an open TarFile.
+    """
+
+    for asset in batch:
+        fullpath = join(directory, asset.localpath)
+        entry = tf.gettarinfo(fullpath, arcname=asset.localpath)
+
+        with open(fullpath, 'rb') as af:
+            tf.addfile(entry, fileobj=af)
+
+def discover_assets(directory, hash_workers=1, cache=None, metrics=None, include=(), exclude=()):
+    """
+    Recursively discover and fingerprint each asset file beneath "directory".
+    When "hash_workers" is greater than one, files are fingerprinted
+    concurrently by a thread pool; hashlib and file reads release the GIL, so
+    this scales with the number of cores. Either way, the returned AssetSet is
+    populated in directory walk order.
+
+    If a FingerprintCache is given, files whose stat() results are unchanged
+    since they were last fingerprinted are not read at all. Only files that
+    match the "include" glob patterns, if any, and that don't match the
+    "exclude" patterns are discovered.
+    """
+
+    if metrics is None:
+        metrics = Metrics()
+
+    logging.debug('Discovering and fingerprinting asset files within {}.'.format(directory))
+
+    entries = []
+    with metrics.phase('discovery') as discovery:
+        for entry in scan_files(directory, include, exclude):
+            entries.append(entry)
+            discovery.bytes += entry.size
+        discovery.items = len(entries)
+
+    asset_set = AssetSet()
+    for asset in fingerprint_assets(entries, hash_workers, cache, metrics):
+        asset_set.append(asset)
+
+    logging.info('Discovered {} asset files.'.format(len(asset_set)))
+    return asset_set
+
+def fingerprint_assets(entries, hash_workers=1, cache=None, metrics=None):
+    """
+    Fingerprint the asset file of each FileEntry in "entries", and return a list
+    of the resulting Assets in the same order. When "hash_workers" is greater
+    than one, files are fingerprinted concurrently by a thread pool. If a
+    FingerprintCache is given, files whose stat() results are unchanged since
+    they were last fingerprinted are not read at all.
+    """
+
+    if metrics is None:
+        metrics = Metrics()
+
+    ts = datetime.utcnow()
+    paths = [(entry, cache) for entry in entries]
+
+    assets, hashed = [], 0
+    with metrics.phase('hashing', items=len(paths)) as hashing:
+        if hash_workers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+
+            logging.debug('Fingerprinting with {} workers.'.format(hash_workers))
+            with ThreadPoolExecutor(max_workers=hash_workers) as executor:
+                for asset, asset_hashed in executor.map(_fingerprint_asset, paths):
+                    assets.append(asset)
+                    hashed += asset_hashed
+        else:
+            for asset, asset_hashed in map(_fingerprint_asset, paths):
+                assets.append(asset)
+                hashed += asset_hashed
+        hashing.bytes = hashed
+
+    elapsed = datetime.utcnow() - ts
+    logging.debug('Fingerprinted {} bytes in {} ({}).'.format(
+        hashed,
+        elapsed,
+        throughput(hashed, elapsed)
+    ))
+    return assets
+
+def _fingerprint_asset(args):
+    """
+    Fingerprint a single asset file, consulting the cache if one is present.
+    Return the Asset and the number of bytes that were actually hashed.
+    """
+
+    entry, cache = args
+
+    if cache is not None:
+        fingerprint = cache.lookup(entry.fullpath, entry.stat)
+        if fingerprint is not None:
+            return Asset(entry.localpath, fingerprint=fingerprint, size=entry.size), 0
+
+    with open(entry.fullpath, 'rb') as af:
+        asset = Asset(entry.localpath, af)
+
+    if cache is not None:
+        cache.store(entry.fullpath, entry.stat, asset.fingerprint)
+
+    return asset, asset.size
+
+def submit_envelopes(directory, asset_set, content_id_base, content_service, cache=None,
+                     envelope_workers=1, envelope_set=None, manifest=None, metrics=None,
+                     streaming=False, batch_size=0):
     """
     Enumerate metadata envelopes within "directory". Inject asset public URLs
     into each, then compute a fingerprint based on a stable representation
@@ -123,33 +642,144 @@ def submit_envelopes(directory, asset_set, content_id_base, content_service):
     which envelopes are already present on the content service. Construct
     a tarball containing the rest and perform a bulk upload of the missing
     envelopes.
-    """
 
-    envelope_set = EnvelopeSet()
+    If a FingerprintCache is given, envelopes whose files and referenced asset
+    URLs are unchanged reuse their previous fingerprints.
 
-    logging.debug('Discovering and parsing envelopes within {}.'.format(directory))
-    for entry in os.scandir(directory):
-        if entry.is_dir():
-            # TODO Output a warning
-            continue
+    When "envelope_workers" is greater than one, envelopes are parsed and
+    fingerprinted by a pool of processes that return only their fingerprints.
+    Envelopes that must be uploaded are read again afterwards. An EnvelopeSet
+    that has already been read, by parse_envelopes or otherwise, may be passed
+    as "envelope_set" instead; it's used as it is, without the cache.
 
-        if not entry.name.endswith(".json"):
-            continue
+    When "streaming" is set, each envelope's document is discarded as soon as
+    it's been fingerprinted. Envelopes that must be uploaded are read again one
+    at a time while the tarball is uploaded with chunked transfer encoding, so
+    memory use doesn't grow with the size of the envelopes.
 
-        with open(entry.path, 'r') as ef:
-            envelope = Envelope(entry.path, ef)
-            envelope_set.append(envelope)
-    logging.info('Discovered {} envelopes.'.format(len(envelope_set)))
+    If "batch_size" is set, envelopes are uploaded in as many tarballs of
+    roughly that many bytes as they need. Each tarball's keep.json lists every
+    envelope that isn't in it, so that no batch deletes another's envelopes.
+
+    If a Manifest is given, envelopes that are unchanged since the last
+    successful submit are not checked with the content service. They're
+    still listed in keep.json. If no envelope was changed, added, or removed
+    since then, nothing is uploaded at all. Each phase is measured by
+    "metrics", if given.
+    """
+
+    if metrics is None:
+        metrics = Metrics()
 
-    envelope_set.apply_asset_offsets(asset_set)
+    ts = datetime.utcnow()
+
+    if envelope_set is None and envelope_workers > 1:
+        with metrics.phase('envelope_parse') as parse:
+            entries = list(_envelope_entries(directory))
+            envelope_set = _process_envelopes(entries, asset_set, cache, envelope_workers)
+            parse.items = len(envelope_set)
+    elif envelope_set is None and (streaming or cache is not None):
+        with metrics.phase('envelope_parse') as parse:
+            envelope_set = _fingerprint_envelopes(directory, asset_set, cache, release=streaming)
+            parse.items = len(envelope_set)
+    elif envelope_set is None:
+        envelope_set = parse_envelopes(directory, metrics)
+    logging.debug('Processed {} envelopes in {}.'.format(len(envelope_set), datetime.utcnow() - ts))
 
-    check_response = content_service.checkcontent(envelope_set.fingerprint_query())
+    with metrics.phase('envelope_serialize', items=len(envelope_set)):
+        envelope_set.apply_asset_offsets(asset_set)
+        query = envelope_set.fingerprint_query()
+
+    check_response = _envelope_presence(query, content_service, manifest, metrics)
     envelope_set.accept_presence(check_response)
 
-    logging.debug('Creating envelope tarball.')
+    content_ids = [e.content_id() for e in envelope_set.all()]
+    uploads = list(envelope_set.to_upload())
+    if not uploads and manifest is not None and manifest.same_envelopes(content_ids):
+        # Nothing would be uploaded or deleted, so skip the bulk upload.
+        logging.info('No envelopes were changed, added, or removed since the last submit.')
+        batches = []
+    elif batch_size and uploads:
+        plan = BatchPlan(uploads, batch_size, measure=_envelope_measure)
+        logging.debug('Planned {} envelope batches of {} bytes.'.format(
+            len(plan),
+            ', '.join(str(size) for size in plan.sizes)
+        ))
+        batches = list(plan)
+    else:
+        batches = [uploads]
+
+    accepted, deleted, failed = 0, 0, 0
+    for n, batch in enumerate(batches, 1):
+        in_batch = set(e.content_id() for e in batch)
+        keep = [content_id for content_id in content_ids if content_id not in in_batch]
+
+        upload_response = _upload_envelope_batch(
+            content_service, directory, asset_set, content_id_base, n, batch, keep, streaming, metrics
+        )
+        accepted += upload_response['accepted']
+        deleted += upload_response['deleted']
+        failed += upload_response['failed']
+
+    return EnvelopeSubmitResult(
+        envelope_set=envelope_set,
+        uploaded=accepted,
+        present=len(content_ids) - len(uploads),
+        deleted=deleted,
+        failed=failed
+    )
+
+def _envelope_measure(envelope):
+    """
+    Return the size and name by which an envelope is planned into a batch.
+    """
+
+    return envelope.encoded_size(), envelope.fname
+
+def _upload_envelope_batch(content_service, directory, asset_set, content_id_base, n, batch, keep,
+                           streaming, metrics):
+    """
+    Construct the tarball for a single batch of envelopes, listing "keep" in
+    its keep.json, and upload it. Return the content service's response.
+    """
+
+    def build(fileobj):
+        tf = open_tarball(fileobj)
+        _write_envelope_archive(tf, directory, asset_set, content_id_base, batch, keep, streaming)
+        tf.close()
+
+    logging.debug('Creating envelope tarball for batch {}.'.format(n))
     ts = datetime.utcnow()
-    envelope_archive = io.BytesIO()
-    tf = tarfile.open(fileobj=envelope_archive, mode='w:gz')
+    if streaming:
+        # Pass a factory so that the archive can be regenerated for a retry.
+        with metrics.phase('envelope_upload', items=len(batch)):
+            upload_response = content_service.bulkcontent(lambda: stream_archive(build))
+        logging.debug('Uploaded tarball containing {} envelopes for batch {} in {}.'.format(
+            len(batch), n, datetime.utcnow() - ts
+        ))
+    else:
+        with metrics.phase('envelope_archive', items=len(batch)) as archive:
+            envelope_archive = io.BytesIO()
+            build(envelope_archive)
+            archive_data = envelope_archive.getvalue()
+            archive.bytes = len(archive_data)
+        logging.debug('Created tarball containing {} envelopes for batch {} in {}.'.format(
+            len(batch), n, datetime.utcnow() - ts
+        ))
+
+        with metrics.phase('envelope_upload', items=len(batch), nbytes=len(archive_data)):
+            upload_response = content_service.bulkcontent(archive_data)
+
+    return upload_response
+
+def _write_envelope_archive(tf, directory, asset_set, content_id_base, envelopes, keep, release):
+    """
+    Add the metadata entries and each of "envelopes" to an open TarFile. If
+    "release" is set, each envelope's document is discarded again once it's
+    been written.
+    """
+
+    import tarfile
 
     # Metadata entry: metadata/config.json
     config = { 'contentIDBase': content_id_base }
@@ -159,20 +789,22 @@ def submit_envelopes(directory, asset_set, content_id_base, content_service):
     tf.addfile(config_entry, io.BytesIO(config_data))
 
     # Metadata entry: metadata/keep.json
-    keep = { 'keep': [e.content_id() for e in envelope_set.to_keep()] }
-    keep_data = json.dumps(keep).encode('utf-8')
+    keep_data = json.dumps({ 'keep': keep }).encode('utf-8')
     keep_entry = tarfile.TarInfo('metadata/keep.json')
     keep_entry.size = len(keep_data)
     tf.addfile(keep_entry, io.BytesIO(keep_data))
 
     # Uploaded envelopes themselves
     uploaded = 0
-    for envelope in envelope_set.to_upload():
+    for envelope in envelopes:
         envelope_path = relpath(envelope.fname, directory)
         envelope_entry = tarfile.TarInfo(envelope_path)
-        envelope_buffer = envelope.serialize().encode('utf-8')
+        envelope.load(asset_set)
+        envelope_buffer = envelope.encode()
         envelope_entry.size = len(envelope_buffer)
         tf.addfile(envelope_entry, io.BytesIO(envelope_buffer))
+        if release:
+            envelope.release()
 
         # Log the first ten envelopes.
         if uploaded < 10:
@@ -183,27 +815,213 @@ def submit_envelopes(directory, asset_set, content_id_base, content_service):
 
         uploaded += 1
 
-    tf.close()
-    logging.debug('Created tarball containing {} envelopes in {}.'.format(uploaded, datetime.utcnow() - ts))
+def throughput(nbytes, elapsed):
+    """
+    Format a byte count processed over a timedelta as a human-readable rate.
+    """
 
-    upload_response = content_service.bulkcontent(envelope_archive.getvalue())
+    seconds = elapsed.total_seconds()
+    if seconds <= 0:
+        return 'n/a'
+    return '{:.1f} MB/s'.format(nbytes / seconds / 1000000)
 
-    return EnvelopeSubmitResult(
-        envelope_set=envelope_set,
-        uploaded=upload_response['accepted'],
-        present=len(keep['keep']),
-        deleted=upload_response['deleted'],
-        failed=upload_response['failed']
-    )
+
+def _fingerprint_envelope(envelope, st, asset_set, cache):
+    """
+    Apply asset offsets to an envelope and fingerprint it, or reuse a cached
+    fingerprint if the envelope file and the asset URLs it references are
+    unchanged.
+    """
+
+    localpaths = envelope.asset_paths()
+    salt = asset_context(localpaths, asset_set)
+
+    fingerprint = cache.lookup(envelope.fname, st, salt)
+    if fingerprint is not None:
+        # The document is only needed again if this envelope must be uploaded.
+        envelope.reuse_fingerprint(fingerprint)
+        envelope.release()
+    else:
+        envelope.apply_asset_offsets(asset_set)
+        cache.store(envelope.fname, st, envelope.fingerprint(), salt, localpaths)
+
+def _cached_envelope(fname, st, asset_set, cache):
+    """
+    Return an Envelope that carries only the cached fingerprint of "fname" if
+    neither the file nor the public URLs of the assets it refers to have
+    changed, without reading the file. Otherwise, return None.
+    """
+
+    candidate = cache.candidate(fname, st)
+    if candidate is None:
+        return None
+
+    salt, fingerprint, localpaths = candidate
+    if asset_context(localpaths, asset_set) != salt:
+        return None
+
+    # Counts the hit.
+    cache.lookup(fname, st, salt)
+    return Envelope(fname, fingerprint=fingerprint)
+
+
+def parse_envelopes(directory, metrics=None):
+    """
+    Read and parse each metadata envelope within "directory". Return the
+    resulting EnvelopeSet.
+    """
+
+    if metrics is None:
+        metrics = Metrics()
+
+    envelope_set = EnvelopeSet()
+    with metrics.phase('envelope_parse') as parse:
+        for entry in _envelope_entries(directory):
+            with open(entry.path, 'r') as ef:
+                envelope = Envelope(entry.path, ef)
+                envelope_set.append(envelope)
+                parse.bytes += os.fstat(ef.fileno()).st_size
+        parse.items = len(envelope_set)
+    return envelope_set
+
+def _fingerprint_envelopes(directory, asset_set, cache=None, release=True):
+    """
+    Read, apply asset offsets to, and fingerprint each envelope within
+    "directory" one at a time. Envelopes with cached fingerprints are not read
+    at all. When "release" is set, each document is discarded once its
+    fingerprint is known, so that the Envelopes carry only their filenames and
+    fingerprints.
+    """
+
+    envelope_set = EnvelopeSet()
+    for entry in _envelope_entries(directory):
+        if cache is not None:
+            envelope = _cached_envelope(entry.path, entry.stat(), asset_set, cache)
+            if envelope is not None:
+                envelope_set.append(envelope)
+                continue
+
+        with open(entry.path, 'r') as ef:
+            envelope = Envelope(entry.path, ef)
+
+        if cache is not None:
+            _fingerprint_envelope(envelope, entry.stat(), asset_set, cache)
+        else:
+            envelope.apply_asset_offsets(asset_set)
+        envelope.fingerprint()
+        if release:
+            envelope.release()
+
+        envelope_set.append(envelope)
+    return envelope_set
+
+def _envelope_entries(directory):
+    """
+    Generate the DirEntry of each envelope file within "directory".
+    """
+
+    logging.debug('Discovering and parsing envelopes within {}.'.format(directory))
+    count = 0
+    for entry in os.scandir(directory):
+        if entry.is_dir():
+            # TODO Output a warning
+            continue
+
+        if not entry.name.endswith(".json"):
+            continue
+
+        count += 1
+        yield entry
+    logging.info('Discovered {} envelopes.'.format(count))
+
+def _process_envelopes(entries, asset_set, cache, envelope_workers):
+    """
+    Parse, apply asset offsets to, and fingerprint each envelope file within a
+    process pool. Return an EnvelopeSet of Envelopes that carry only their
+    fingerprints, in the order of "entries".
+    """
+
+    logging.debug('Processing envelopes with {} workers.'.format(envelope_workers))
+
+    # Envelopes with cached fingerprints aren't sent to a worker at all.
+    envelopes, tasks = [], []
+    for entry in entries:
+        envelope = None
+        if cache is not None:
+            envelope = _cached_envelope(entry.path, entry.stat(), asset_set, cache)
+        if envelope is None:
+            tasks.append(entry.path)
+        envelopes.append(envelope)
+
+    # Each chunk carries the asset public URLs, from which its worker rebuilds
+    # an AssetSet. Chunks are large, so that this happens only a few times per
+    # worker.
+    chunk_size = max(ENVELOPE_CHUNKSIZE, -(-len(tasks) // (envelope_workers * ENVELOPE_CHUNKS_PER_WORKER)))
+    public_urls = asset_set.public_urls()
+    chunks = [(public_urls, tasks[i:i + chunk_size]) for i in range(0, len(tasks), chunk_size)]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    envelope_set = EnvelopeSet()
+    with ProcessPoolExecutor(max_workers=envelope_workers) as executor:
+        results = itertools.chain.from_iterable(executor.map(_process_envelope_chunk, chunks))
+        for envelope, entry in zip(envelopes, entries):
+            if envelope is None:
+                fname, fingerprint, salt, localpaths = next(results)
+                envelope = Envelope(fname, fingerprint=fingerprint)
+
+                if cache is not None:
+                    st = entry.stat()
+                    if cache.lookup(fname, st, salt) is None:
+                        cache.store(fname, st, fingerprint, salt, localpaths)
+
+            envelope_set.append(envelope)
+
+    return envelope_set
+
+def _process_envelope_chunk(chunk):
+    """
+    Process a chunk of envelopes within a worker process, given the asset
+    public URLs that they refer to. Return the result of each.
+    """
+
+    public_urls, tasks = chunk
+
+    asset_set = AssetSet()
+    for localpath, public_url in public_urls.items():
+        asset = Asset(localpath)
+        asset.public_url = public_url
+        asset_set.append(asset)
+
+    return [_process_envelope(task, asset_set) for task in tasks]
+
+def _process_envelope(fname, asset_set):
+    """
+    Parse and fingerprint a single envelope within a worker process. Return its
+    filename, fingerprint, asset context salt, and the local paths of the
+    assets that the salt depends on.
+    """
+
+    with open(fname, 'r') as ef:
+        envelope = Envelope(fname, ef)
+
+    localpaths = envelope.asset_paths()
+    salt = asset_context(localpaths, asset_set)
+    envelope.apply_asset_offsets(asset_set)
+    return fname, envelope.fingerprint(), salt, localpaths
 
 
 class AssetSubmitResult():
 
-    def __init__(self, asset_set, uploaded, present, batches):
+    def __init__(self, asset_set, uploaded, present, batches, batch_sizes=None,
+                 deduplicated=0, bytes_saved=0):
         self.asset_set = asset_set
         self.uploaded = uploaded
         self.present = present
         self.batches = batches
+        self.batch_sizes = batch_sizes or []
+        self.deduplicated = deduplicated
+        self.bytes_saved = bytes_saved
 
 
 class EnvelopeSubmitResult():
@@ -217,7 +1035,9 @@ class EnvelopeSubmitResult():
 
 class SubmitResult():
 
-    def __init__(self, asset_result, envelope_result, state):
+    def __init__(self, asset_result, envelope_result, state, retries=0, metrics=None):
         self.asset_result = asset_result
         self.envelope_result = envelope_result
         self.state = state
+        self.retries = retries
+        self.metrics = metrics or Metrics()
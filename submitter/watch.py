@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import threading
+from datetime import datetime
+
+from .asset import AssetSet
+from .cache import FingerprintCache
+from .discovery import FileEntry, scan_files
+from .content_service import shared_session
+from .envelope import Envelope, EnvelopeSet
+from .manifest import Manifest
+from .submit import submit, fingerprint_assets, open_cache, open_manifest, FAILURE
+
+# Default number of seconds between scans for changes.
+DEFAULT_INTERVAL = 1.0
+
+# Default number of seconds that the trees must stay unchanged before a burst
+# of changes is submitted.
+DEFAULT_DEBOUNCE = 0.25
+
+def snapshot(config):
+    """
+    Map the full path of each asset and envelope file to its size, mtime,
+    inode, and local path. Envelopes have no local path.
+    """
+
+    files = {}
+    for entry in scan_files(config.asset_dir, config.asset_include, config.asset_exclude):
+        files[entry.fullpath] = (entry.size, entry.mtime_ns, entry.stat.st_ino, entry.localpath)
+
+    for entry in os.scandir(config.envelope_dir):
+        if entry.name.endswith('.json') and entry.is_file():
+            st = entry.stat()
+            files[entry.path] = (st.st_size, st.st_mtime_ns, st.st_ino, None)
+    return files
+
+def changed_paths(before, after):
+    """
+    Return the sorted paths of files added, modified, or removed between two
+    snapshots.
+    """
+
+    return sorted(
+        path for path in before.keys() | after.keys()
+        if before.get(path) != after.get(path)
+    )
+
+class Watcher():
+    """
+    Submit a site, then submit it again whenever its asset or envelope files
+    change, from one long-running process.
+
+    The trees are scanned for changes every "interval" seconds. Once a change
+    is seen, they're scanned again every "debounce" seconds until they stop
+    changing, so that a burst of writes leads to a single submit.
+
+    The AssetSet, the envelopes and their fingerprints, the manifest of what
+    the content service holds, and the connection pool are kept between
+    submits. Each submit reads only the files that changed since the last one,
+    along with envelopes that refer to changed assets, and checks and uploads
+    only those. A submit that fails is retried after the next interval even if
+    nothing else changes.
+    """
+
+    def __init__(self, config, session=None, interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE):
+        self.config = config
+        self.interval = interval
+        self.debounce = debounce
+
+        self.session = session
+        if not self.session:
+            self.session = shared_session(config.pool_size)
+
+        self.cache = open_cache(config)
+        if self.cache is None:
+            self.cache = FingerprintCache(None)
+
+        self.manifest = open_manifest(config)
+        if self.manifest is None:
+            self.manifest = Manifest(None, config.content_service_url, config.content_id_base)
+
+        self.files = {}
+        self.pending = True
+        self.submits = 0
+
+        # Each changed path that hasn't been read yet, with its last snapshot.
+        self.changes = {}
+
+        self.asset_set = AssetSet()
+        self.envelopes = {}
+        self.envelope_assets = {}
+
+    def poll(self):
+        """
+        Scan the trees and return the paths that changed since the last scan.
+        """
+
+        files = snapshot(self.config)
+        changes = changed_paths(self.files, files)
+        for path in changes:
+            self.changes[path] = files.get(path) or self.files[path]
+        self.files = files
+        return changes
+
+    def update(self):
+        """
+        Bring the AssetSet and the envelopes up to date with the files that
+        changed since the last update. Envelopes whose asset offsets refer to a
+        changed asset are read again too, since its public URL may change.
+        """
+
+        changed_assets, entries, changed_envelopes = set(), [], set()
+        for path, (size, mtime_ns, inode, localpath) in sorted(self.changes.items()):
+            if localpath is None:
+                changed_envelopes.add(path)
+                continue
+
+            changed_assets.add(localpath)
+            self.asset_set.discard(localpath)
+            if path in self.files:
+                entries.append(FileEntry(localpath, path, os.stat(path)))
+
+        for asset in fingerprint_assets(entries, self.config.hash_workers, self.cache):
+            self.asset_set.append(asset)
+
+        for fname, localpaths in self.envelope_assets.items():
+            if changed_assets.intersection(localpaths):
+                changed_envelopes.add(fname)
+
+        for fname in changed_envelopes:
+            self.envelopes.pop(fname, None)
+            self.envelope_assets.pop(fname, None)
+            if fname not in self.files:
+                continue
+
+            with open(fname, 'r') as ef:
+                envelope = Envelope(fname, ef)
+            self.envelopes[fname] = envelope
+            self.envelope_assets[fname] = envelope.asset_paths()
+
+        logging.debug('Read {} changed assets and {} changed envelopes.'.format(
+            len(entries), len(changed_envelopes)
+        ))
+        self.changes.clear()
+
+    def wait(self, stop):
+        """
+        Block until a burst of changes has settled, or a failed submit is due
+        to be retried, and return the paths that changed. Return None if "stop"
+        is set first.
+        """
+
+        changes = set()
+        while not stop.wait(self.interval):
+            changes.update(self.poll())
+            if changes or self.pending:
+                break
+        else:
+            return None
+
+        while not stop.wait(self.debounce):
+            settling = self.poll()
+            if not settling:
+                return sorted(changes)
+            changes.update(settling)
+        return None
+
+    def submit(self):
+        """
+        Submit the current state of the trees and return its SubmitResult.
+        """
+
+        start = datetime.utcnow()
+        self.poll()
+        self.update()
+
+        envelope_set = EnvelopeSet()
+        for fname in sorted(self.envelopes):
+            envelope_set.append(self.envelopes[fname])
+
+        # Files that weren't read again are still current, so the cache keeps
+        # their fingerprints when it's saved.
+        self.cache.retain(self.files)
+        result = submit(self.config, self.session, self.cache, self.manifest, self.asset_set, envelope_set)
+        finish = datetime.utcnow()
+
+        # Only fingerprints are kept. An envelope that must be uploaded again is
+        # read from disk then.
+        for envelope in envelope_set.all():
+            envelope.release()
+
+        self.submits += 1
+        self.pending = result.state is FAILURE
+        logging.info('Submit {}: uploaded {} assets and {} envelopes in {}: {}.'.format(
+            self.submits,
+            result.asset_result.uploaded,
+            result.envelope_result.uploaded,
+            finish - start,
+            result.state
+        ))
+        return result
+
+    def run(self, stop=None):
+        """
+        Submit the trees, then resubmit them after each change until "stop", a
+        threading.Event, is set.
+        """
+
+        if stop is None:
+            stop = threading.Event()
+
+        while not stop.is_set():
+            try:
+                self.submit()
+            except Exception as e:
+                logging.error('Submit failed: {}'.format(e))
+                self.pending = True
+
+            changes = self.wait(stop)
+            if changes is None:
+                break
+            if changes:
+                logging.info('Detected {} changed files.'.format(len(changes)))
+                for path in changes:
+                    logging.debug('  ' + path)
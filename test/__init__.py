@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
 import os
 
 from betamax import Betamax
@@ -16,3 +17,17 @@ with Betamax.configure() as config:
     config.cassette_library_dir = 'test/fixtures/cassettes'
     config.define_cassette_placeholder('<APIKEY>', APIKEY)
     config.default_cassette_options['serialize_with'] = 'prettyjson'
+
+def run(coroutine):
+    """
+    Run "coroutine" to completion on a new event loop and return its result.
+    Stands in for asyncio.run(), which is new in Python 3.7.
+    """
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import tarfile
+
+from nose.tools import assert_equal, assert_true, assert_raises
+
+from submitter.asset import Asset
+from submitter.archive import CompressionPolicy, open_tarball, precompressed_share, \
+    stream_archive, CHUNK_SIZE
+
+def sized(localpath, size):
+    return Asset(localpath, fingerprint='0' * 64, size=size)
+
+def test_stream_archive():
+    contents = [os.urandom(20000) for i in range(20)]
+
+    def build(fileobj):
+        tf = open_tarball(fileobj)
+        for i, data in enumerate(contents):
+            entry = tarfile.TarInfo('file-{:02d}.bin'.format(i))
+            entry.size = len(data)
+            tf.addfile(entry, io.BytesIO(data))
+        tf.close()
+
+    chunks = list(stream_archive(build, queue_depth=2))
+    assert_true(len(chunks) > 1)
+    for chunk in chunks:
+        assert_true(len(chunk) > 0)
+
+    tf = tarfile.open(fileobj=io.BytesIO(b''.join(chunks)), mode='r:gz')
+    assert_equal(len(tf.getnames()), 20)
+    assert_equal(tf.extractfile('file-07.bin').read(), contents[7])
+
+def test_stream_archive_failure():
+    def build(fileobj):
+        fileobj.write(b'partial')
+        raise ValueError('oops')
+
+    with assert_raises(ValueError):
+        list(stream_archive(build))
+
+def test_stream_archive_abandoned():
+    def build(fileobj):
+        while True:
+            fileobj.write(b'x' * 1024)
+
+    chunks = stream_archive(build, queue_depth=1)
+    assert_true(len(next(chunks)) >= CHUNK_SIZE)
+
+    # Closing the generator early stops the writer thread rather than leaving
+    # it blocked on a full queue.
+    chunks.close()
+
+def test_precompressed_share():
+    assert_equal(precompressed_share([]), 0.0)
+    assert_equal(precompressed_share([sized('a.png', 300), sized('b.css', 100)]), 0.75)
+    assert_equal(precompressed_share([sized('A.JPG', 100)]), 1.0)
+
+def test_compression_policy():
+    images = [sized('a.png', 1000), sized('b.woff2', 1000)]
+    text = [sized('a.css', 1000), sized('b.js', 1000)]
+
+    assert_equal(CompressionPolicy('gzip', 6).level_for(images), 6)
+    assert_equal(CompressionPolicy('none', 6).level_for(text), 0)
+    assert_equal(CompressionPolicy('auto', 6).level_for(images), 0)
+    assert_equal(CompressionPolicy('auto', 6).level_for(text), 6)
+
+def test_uncompressed_tarball_is_gzip():
+    buf = io.BytesIO()
+    tf = open_tarball(buf, 0)
+    data = b'a' * 10000
+    entry = tarfile.TarInfo('a.txt')
+    entry.size = len(data)
+    tf.addfile(entry, io.BytesIO(data))
+    tf.close()
+
+    assert_true(len(buf.getvalue()) > len(data))
+
+    buf.seek(0)
+    tf = tarfile.open(fileobj=buf, mode='r:gz')
+    assert_equal(tf.extractfile('a.txt').read(), data)
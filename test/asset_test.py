@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import io
+import hashlib
 
 from nose.tools import assert_equal, assert_is, assert_is_none, assert_false, \
     assert_true, assert_in, assert_not_in
-from submitter.asset import Asset, AssetSet
+from submitter.asset import Asset, AssetSet, fingerprint_stream
 
 class TestAsset():
 
@@ -17,6 +18,17 @@ class TestAsset():
         # echo -n "this is totally a jpg" | shasum -a 256
         assert_equal(asset.fingerprint, '0ce34a6ca011d365236867577a770a038a91b0474057d275689e51ed6c1affa1')
 
+    def test_fingerprint_digest(self):
+        asset = Asset('local/image.jpg', fingerprint='0ce34a6ca011d365236867577a770a038a91b0474057d275689e51ed6c1affa1', size=21)
+
+        assert_equal(asset.fingerprint, '0ce34a6ca011d365236867577a770a038a91b0474057d275689e51ed6c1affa1')
+        assert_equal(len(asset._digest), 32)
+        assert_false(hasattr(asset, '__dict__'))
+
+    def test_size(self):
+        asset = Asset('local/image.jpg', self.data)
+        assert_equal(asset.size, 21)
+
     def test_public_url(self):
         asset = Asset('local/image.jpg', self.data)
         assert_is_none(asset.public_url)
@@ -29,6 +41,28 @@ class TestAsset():
         assert_false(asset.needs_upload())
         assert_equal(asset.public_url, 'https://cdn.horse/image-0ce34a6c.jpg')
 
+def test_fingerprint_stream_chunks():
+    data = b'0123456789' * 1000
+
+    # Chunk sizes that do and do not evenly divide the stream.
+    for chunk_size in (7, 1000, 4096, 100000):
+        fingerprint, size = fingerprint_stream(io.BytesIO(data), chunk_size)
+        assert_equal(fingerprint, hashlib.sha256(data).hexdigest())
+        assert_equal(size, len(data))
+
+def test_fingerprint_stream_without_readinto():
+    class ReadOnly():
+        def __init__(self, data):
+            self.inner = io.BytesIO(data)
+
+        def read(self, n):
+            return self.inner.read(n)
+
+    data = b'abc' * 5000
+    fingerprint, size = fingerprint_stream(ReadOnly(data), 1024)
+    assert_equal(fingerprint, hashlib.sha256(data).hexdigest())
+    assert_equal(size, len(data))
+
 class TestAssetSet():
 
     def setup(self):
@@ -103,3 +137,28 @@ class TestAssetSet():
         to_upload = [a for a in asset_set.to_upload()]
         assert_not_in(self.asset0, to_upload)
         assert_in(self.asset1, to_upload)
+
+    def test_duplicates(self):
+        copy0 = Asset('other/image.jpg', io.BytesIO(b'this is totally a jpg'))
+        renamed = Asset('local/renamed.jpg', io.BytesIO(b'this is totally a jpg'))
+
+        asset_set = AssetSet()
+        asset_set.append(self.asset0)
+        asset_set.append(copy0)
+        asset_set.append(renamed)
+
+        # Copies with a different name are uploaded separately.
+        assert_equal([a.localpath for a in asset_set.unique_uploads()], ['local/image.jpg', 'local/renamed.jpg'])
+        assert_equal(asset_set.duplicate_uploads(), [copy0])
+
+        # The same copy is chosen whatever order the assets were found in.
+        reversed_set = AssetSet()
+        for asset in (renamed, copy0, self.asset0):
+            reversed_set.append(asset)
+        assert_equal(list(reversed_set.unique_uploads()), list(asset_set.unique_uploads()))
+        assert_equal(reversed_set.duplicate_uploads(), [copy0])
+
+        asset_set.accept_urls({'local/image.jpg': 'https://cdn.horse/image-0ce34a6c.jpg'})
+        assert_equal(copy0.public_url, 'https://cdn.horse/image-0ce34a6c.jpg')
+        assert_is_none(renamed.public_url)
+        assert_equal(asset_set.duplicate_uploads(), [])
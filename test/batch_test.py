@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+from nose.tools import assert_equal, assert_true
+
+from submitter.asset import Asset
+from submitter.batch import BatchPlan, tar_entry_size
+
+def sized(localpath, size):
+    return Asset(localpath, fingerprint='0' * 64, size=size)
+
+def test_tar_entry_size():
+    assert_equal(tar_entry_size(0), 512)
+    assert_equal(tar_entry_size(1), 1024)
+    assert_equal(tar_entry_size(512), 1024)
+    assert_equal(tar_entry_size(10000), 10752)
+
+def test_single_batch():
+    plan = BatchPlan([sized('a', 100), sized('b', 200)], 10000)
+
+    assert_equal(len(plan), 1)
+    assert_equal(plan.sizes, [2048])
+    assert_equal(plan.total(), 2048)
+
+def test_empty():
+    plan = BatchPlan([], 10000)
+    assert_equal(len(plan), 0)
+
+def test_balanced_batches():
+    assets = [sized('file-{:02d}'.format(i), 10000) for i in range(4)]
+    plan = BatchPlan(assets, 25000)
+
+    assert_equal(len(plan), 2)
+    assert_equal(plan.sizes, [21504, 21504])
+
+def test_large_assets_get_their_own_batch():
+    assets = [
+        sized('small-0', 1000),
+        sized('huge', 500000),
+        sized('small-1', 1000),
+        sized('small-2', 1000)
+    ]
+    plan = BatchPlan(assets, 100000)
+
+    assert_equal(len(plan), 2)
+    assert_equal([a.localpath for a in plan.batches[0]], ['huge'])
+    assert_equal(len(plan.batches[1]), 3)
+
+def test_batches_respect_size():
+    assets = [sized('f{}'.format(i), (i * 7919) % 30000) for i in range(200)]
+    plan = BatchPlan(assets, 100000)
+
+    planned = [a for batch in plan for a in batch]
+    assert_equal(sorted(a.localpath for a in planned), sorted(a.localpath for a in assets))
+
+    for size in plan.sizes:
+        assert_true(size <= 100000)
+
+    # Balanced: no batch is less than half the size of the largest.
+    assert_true(min(plan.sizes) * 2 >= max(plan.sizes))
+
+def test_measure():
+    items = [('a', 100), ('b', 30000), ('c', 200)]
+    plan = BatchPlan(items, 10000, measure=lambda item: (item[1], item[0]))
+
+    assert_equal(len(plan), 2)
+    assert_equal(plan.batches[0], [('b', 30000)])
+    assert_equal(sorted(plan.batches[1]), [('a', 100), ('c', 200)])
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+
+from nose.tools import assert_equal, assert_in
+
+from bench.pipeline import run_scenarios, regressions
+from bench.startup import SCENARIOS, measure_startup, parse_importtime, unexpected_imports
+from bench.trees import TreeSpec, generate_tree
+
+class TestPipelineBench():
+
+    def setup(self):
+        self.root = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.root)
+
+    def test_scenarios(self):
+        spec = TreeSpec(assets=12, asset_size=500, envelopes=6, body_size=200, offsets=3)
+        asset_dir, envelope_dir = generate_tree(self.root, spec)
+
+        scenarios = run_scenarios(asset_dir, envelope_dir, {'ASSET_BATCH_SIZE': '4000'}, memory=True)
+
+        cold, warm = scenarios['cold'], scenarios['warm']
+        assert_equal(cold['state'], 'success')
+        assert_equal(cold['gauges']['assets_uploaded'], 12)
+        assert_equal(cold['gauges']['envelopes_uploaded'], 6)
+        assert_in('asset_upload', cold['phases'])
+
+        assert_equal(warm['state'], 'noop')
+        assert_equal(warm['gauges']['assets_uploaded'], 0)
+        assert_equal(warm['gauges']['envelopes_deleted'], 0)
+
+    def test_streaming_scenarios(self):
+        spec = TreeSpec(assets=12, asset_size=500, envelopes=6, body_size=200, offsets=3)
+        asset_dir, envelope_dir = generate_tree(self.root, spec)
+
+        settings = {'ASSET_STREAMING': '1', 'ENVELOPE_STREAMING': '1'}
+        scenarios = run_scenarios(asset_dir, envelope_dir, settings, memory=False)
+
+        # The warm run only finds nothing to do if the streamed envelopes matched
+        # their fingerprints.
+        assert_equal(scenarios['cold']['gauges']['envelopes_uploaded'], 6)
+        assert_equal(scenarios['warm']['state'], 'noop')
+
+    def test_regressions(self):
+        def record(seconds):
+            return {'scenarios': {'cold': {'phases': {
+                'hashing': {'seconds': seconds},
+                'discovery': {'seconds': seconds / 1000}
+            }}}}
+
+        found = regressions(record(1.5), record(1.0), 0.1)
+        assert_equal(found, [('cold', 'hashing', 1.0, 1.5)])
+        assert_equal(regressions(record(1.05), record(1.0), 0.1), [])
+
+def test_parse_importtime():
+    report = '\n'.join([
+        'import time: self [us] | cumulative | imported package',
+        'import time:       120 |        120 |   _io',
+        'import time:       300 |       2500 | submitter.config',
+        'Invalid configuration.'
+    ])
+    assert_equal(parse_importtime(report), {'_io': 120, 'submitter.config': 2500})
+
+def test_startup_imports():
+    for name, (args, deferred) in sorted(SCENARIOS.items()):
+        status, elapsed, modules = measure_startup(args)
+
+        assert_in('submitter.config', modules)
+        assert_equal(unexpected_imports(modules, deferred), [], name)
+
+def test_startup_imports_without_importtime():
+    for name, (args, deferred) in sorted(SCENARIOS.items()):
+        status, elapsed, modules = measure_startup(args, importtime=False)
+
+        assert_equal(status, measure_startup(args)[0], name)
+        assert_in('submitter.config', modules)
+        assert_equal(set(modules.values()), {0})
+        assert_equal(unexpected_imports(modules, deferred), [], name)
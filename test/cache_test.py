@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from nose.tools import assert_equal, assert_is_none
+
+from submitter.cache import FingerprintCache
+
+class TestFingerprintCache():
+
+    def setup(self):
+        self.workspace = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.workspace, 'fingerprints.db')
+
+        self.asset_path = os.path.join(self.workspace, 'asset.txt')
+        with open(self.asset_path, 'w') as af:
+            af.write('contents')
+
+    def teardown(self):
+        shutil.rmtree(self.workspace)
+
+    def test_miss_then_hit(self):
+        cache = FingerprintCache(self.cache_path)
+        st = os.stat(self.asset_path)
+
+        assert_is_none(cache.lookup(self.asset_path, st))
+        cache.store(self.asset_path, st, 'abc123')
+        assert_equal(cache.lookup(self.asset_path, st), 'abc123')
+
+        assert_equal(cache.hits, 1)
+        assert_equal(cache.misses, 1)
+
+    def test_persistence(self):
+        cache = FingerprintCache(self.cache_path)
+        st = os.stat(self.asset_path)
+        cache.store(self.asset_path, st, 'abc123')
+        cache.save()
+
+        reloaded = FingerprintCache(self.cache_path)
+        assert_equal(reloaded.lookup(self.asset_path, st), 'abc123')
+
+    def test_changed_file(self):
+        cache = FingerprintCache(self.cache_path)
+        cache.store(self.asset_path, os.stat(self.asset_path), 'abc123')
+
+        with open(self.asset_path, 'w') as af:
+            af.write('different contents')
+
+        assert_is_none(cache.lookup(self.asset_path, os.stat(self.asset_path)))
+
+    def test_salt(self):
+        cache = FingerprintCache(self.cache_path)
+        st = os.stat(self.asset_path)
+        cache.store(self.asset_path, st, 'abc123', salt='one')
+
+        assert_is_none(cache.lookup(self.asset_path, st, salt='two'))
+        assert_equal(cache.lookup(self.asset_path, st, salt='one'), 'abc123')
+
+    def test_retain(self):
+        cache = FingerprintCache(self.cache_path)
+        st = os.stat(self.asset_path)
+        cache.store(self.asset_path, st, 'abc123')
+        cache.save()
+
+        # A file that's retained is kept without being looked up.
+        cache.retain([self.asset_path])
+        cache.save()
+
+        reloaded = FingerprintCache(self.cache_path)
+        assert_equal(reloaded.lookup(self.asset_path, st), 'abc123')
+
+    def test_candidate(self):
+        cache = FingerprintCache(self.cache_path)
+        st = os.stat(self.asset_path)
+        cache.store(self.asset_path, st, 'abc123', salt='one', assets=['a.jpg', 'b.gif'])
+        cache.save()
+
+        # The candidate neither counts as a hit nor as a miss.
+        reloaded = FingerprintCache(self.cache_path)
+        assert_equal(reloaded.candidate(self.asset_path, st), ('one', 'abc123', ['a.jpg', 'b.gif']))
+        assert_equal(reloaded.hits + reloaded.misses, 0)
+
+        with open(self.asset_path, 'w') as af:
+            af.write('different contents')
+        assert_is_none(reloaded.candidate(self.asset_path, os.stat(self.asset_path)))
+
+    def test_older_schema(self):
+        with sqlite3.connect(self.cache_path) as db:
+            db.execute(
+                'CREATE TABLE fingerprints (path TEXT PRIMARY KEY, size INTEGER, '
+                'mtime_ns INTEGER, inode INTEGER, salt TEXT, fingerprint TEXT)'
+            )
+            db.execute("INSERT INTO fingerprints VALUES ('x', 1, 1, 1, '', 'abc123')")
+        db.close()
+
+        # The old table is discarded, and the new one can be written.
+        cache = FingerprintCache(self.cache_path)
+        assert_equal(cache.entries, {})
+        cache.store(self.asset_path, os.stat(self.asset_path), 'abc123')
+        cache.save()
+
+    def test_forget_unseen(self):
+        cache = FingerprintCache(self.cache_path)
+        st = os.stat(self.asset_path)
+        cache.store(self.asset_path, st, 'abc123')
+        cache.save()
+
+        # A run that never sees the file drops it from the cache.
+        FingerprintCache(self.cache_path).save()
+
+        reloaded = FingerprintCache(self.cache_path)
+        assert_is_none(reloaded.lookup(self.asset_path, st))
@@ -82,3 +82,260 @@ def test_invalid_batch_size():
 
     assert_false(c.is_valid())
     assert_in('ASSET_BATCH_SIZE must be an integer', c.problems)
+
+def test_hash_workers():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'ASSET_HASH_WORKERS': '16'
+    })
+
+    assert_true(c.is_valid())
+    assert_equal(c.hash_workers, 16)
+
+def test_hash_workers_defaults_to_serial():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo'
+    })
+
+    assert_equal(c.hash_workers, 1)
+
+def test_invalid_hash_workers():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'ASSET_HASH_WORKERS': '0'
+    })
+
+    assert_false(c.is_valid())
+    assert_in('ASSET_HASH_WORKERS must be at least 1', c.problems)
+
+def test_asset_streaming():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'ASSET_STREAMING': 'true'
+    })
+
+    assert_true(c.asset_streaming)
+    assert_false(Config({}).asset_streaming)
+
+def test_envelope_streaming():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'ENVELOPE_STREAMING': 'true'
+    })
+
+    assert_true(c.envelope_streaming)
+    assert_false(Config({}).envelope_streaming)
+
+def test_envelope_batch_size():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'ENVELOPE_BATCH_SIZE': '10000000'
+    })
+
+    assert_true(c.is_valid())
+    assert_equal(c.envelope_batch_size, 10000000)
+    assert_equal(Config({}).envelope_batch_size, 0)
+
+def test_upload_workers():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'ASSET_UPLOAD_WORKERS': '4'
+    })
+
+    assert_true(c.is_valid())
+    assert_equal(c.upload_workers, 4)
+
+def test_asset_compression():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'ASSET_COMPRESSION': 'auto',
+        'ASSET_COMPRESSION_LEVEL': '1'
+    })
+
+    assert_true(c.is_valid())
+    assert_equal(c.asset_compression, 'auto')
+    assert_equal(c.asset_compression_level, 1)
+
+def test_invalid_asset_compression():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'ASSET_COMPRESSION': 'zstd',
+        'ASSET_COMPRESSION_LEVEL': '10'
+    })
+
+    assert_false(c.is_valid())
+    assert_in('ASSET_COMPRESSION must be one of: gzip, none, auto', c.problems)
+    assert_in('ASSET_COMPRESSION_LEVEL must be at most 9', c.problems)
+
+def test_envelope_workers():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'ENVELOPE_WORKERS': '8'
+    })
+
+    assert_true(c.is_valid())
+    assert_equal(c.envelope_workers, 8)
+
+def test_transport_settings():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'CONTENT_SERVICE_POOL_SIZE': '32',
+        'CONTENT_SERVICE_CONNECT_TIMEOUT': '2.5',
+        'CONTENT_SERVICE_READ_TIMEOUT': '600',
+        'CONTENT_SERVICE_RETRIES': '0'
+    })
+
+    assert_true(c.is_valid())
+    assert_equal(c.pool_size, 32)
+    assert_equal(c.connect_timeout, 2.5)
+    assert_equal(c.read_timeout, 600)
+    assert_equal(c.retries, 0)
+
+def test_transport_defaults():
+    c = Config({})
+
+    assert_equal(c.pool_size, 10)
+    assert_equal(c.connect_timeout, 30)
+    assert_equal(c.read_timeout, None)
+    assert_equal(c.retries, 3)
+
+def test_invalid_timeout():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'CONTENT_SERVICE_CONNECT_TIMEOUT': 'soon'
+    })
+
+    assert_false(c.is_valid())
+    assert_in('CONTENT_SERVICE_CONNECT_TIMEOUT must be a number of seconds', c.problems)
+
+def test_check_shards():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'CONTENT_SERVICE_CHECK_SHARD_SIZE': '5000',
+        'CONTENT_SERVICE_CHECK_WORKERS': '8'
+    })
+
+    assert_true(c.is_valid())
+    assert_equal(c.check_shard_size, 5000)
+    assert_equal(c.check_workers, 8)
+
+def test_manifest():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'SUBMITTER_MANIFEST': '/var/cache/submitter/manifest.json',
+        'SUBMITTER_FORCE_FULL': 'true'
+    })
+
+    assert_true(c.is_valid())
+    assert_equal(c.manifest, '/var/cache/submitter/manifest.json')
+    assert_true(c.force_full)
+
+def test_metrics():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'SUBMITTER_METRICS_FILE': '/tmp/metrics.prom',
+        'SUBMITTER_METRICS_FORMAT': 'prometheus'
+    })
+
+    assert_true(c.is_valid())
+    assert_equal(c.metrics_file, '/tmp/metrics.prom')
+    assert_equal(c.metrics_format, 'prometheus')
+
+def test_invalid_metrics_format():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'SUBMITTER_METRICS_FORMAT': 'xml'
+    })
+
+    assert_false(c.is_valid())
+    assert_in('SUBMITTER_METRICS_FORMAT must be one of: json, prometheus', c.problems)
+
+def test_asset_patterns():
+    c = Config({
+        'ENVELOPE_DIR': '/envelopes/',
+        'ASSET_DIR': '/assets/',
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo',
+        'ASSET_EXCLUDE': '.DS_Store, *.map,,'
+    })
+
+    assert_true(c.is_valid())
+    assert_equal(c.asset_include, ())
+    assert_equal(c.asset_exclude, ('.DS_Store', '*.map'))
+
+def test_jobs():
+    c = Config({
+        'CONTENT_SERVICE_APIKEY': '12341234',
+        'CONTENT_SERVICE_URL': 'http://localhost:9000',
+        'SUBMITTER_JOBS': '/etc/submitter/jobs.json',
+        'SUBMITTER_JOBS_CONCURRENCY': '8'
+    })
+
+    assert_equal(c.jobs, '/etc/submitter/jobs.json')
+    assert_equal(c.jobs_concurrency, 8)
+    assert_equal(c.problems, [])
@@ -2,11 +2,15 @@
 
 import os
 import io
+import json
 import tarfile
 
 from betamax import Betamax
-from requests import Session
-from nose.tools import assert_equal, assert_true, assert_false, assert_in
+from requests import Session, Response
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectionError, HTTPError
+from nose.tools import assert_equal, assert_true, assert_false, assert_in, \
+    assert_raises
 
 from . import URL, APIKEY
 from submitter.content_service import ContentService
@@ -100,6 +104,155 @@ class TestContentService():
                 'deleted': 0
             })
 
+class ScriptedAdapter(BaseAdapter):
+    """
+    A transport adapter that answers each request with the next of a list of
+    status codes, or raises ConnectionError for a status of None.
+    """
+
+    def __init__(self, statuses):
+        super().__init__()
+        self.statuses = list(statuses)
+        self.bodies = []
+        self.headers = []
+
+    def send(self, request, **kwargs):
+        self.headers.append(request.headers)
+        body = request.body
+        if body is not None and not isinstance(body, (bytes, str)):
+            body = b''.join(body)
+        self.bodies.append(body)
+
+        status = self.statuses.pop(0)
+        if status is None:
+            raise ConnectionError('connection reset')
+
+        response = Response()
+        response.status_code = status
+        response.raw = io.BytesIO(b'{"ok": true}')
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+class TestContentServiceRetries():
+
+    def service(self, statuses, retries=3):
+        session = Session()
+        adapter = ScriptedAdapter(statuses)
+        session.mount('http://', adapter)
+        cs = ContentService(url='http://content', apikey=APIKEY, session=session,
+                            retries=retries, backoff=0)
+        return cs, adapter
+
+    def test_retry_check(self):
+        cs, adapter = self.service([502, None, 200])
+
+        assert_equal(cs.checkassets({'a': 'b'}), {'ok': True})
+        assert_equal(cs.retries_made, 2)
+
+    def test_retries_exhausted(self):
+        cs, adapter = self.service([503, 503], retries=1)
+
+        with assert_raises(HTTPError):
+            cs.checkcontent({'a': 'b'})
+        assert_equal(cs.retries_made, 1)
+
+    def test_client_errors_are_not_retried(self):
+        cs, adapter = self.service([400])
+
+        with assert_raises(HTTPError):
+            cs.checkcontent({'a': 'b'})
+        assert_equal(cs.retries_made, 0)
+
+    def test_retry_buffered_upload(self):
+        cs, adapter = self.service([502, 200])
+        tarball = io.BytesIO(b'tarball')
+
+        assert_equal(cs.bulkasset(tarball), {'ok': True})
+        assert_equal(adapter.bodies, [b'tarball', b'tarball'])
+
+    def test_retry_regenerated_upload(self):
+        cs, adapter = self.service([None, 200])
+        generated = []
+
+        def tarball():
+            generated.append(True)
+            return iter([b'tar', b'ball'])
+
+        assert_equal(cs.bulkasset(tarball), {'ok': True})
+        assert_equal(len(generated), 2)
+        assert_equal(adapter.bodies, [b'tarball', b'tarball'])
+
+    def test_streams_are_not_retried(self):
+        cs, adapter = self.service([502, 200])
+
+        with assert_raises(HTTPError):
+            cs.bulkasset(iter([b'tarball']))
+        assert_equal(cs.retries_made, 0)
+
+    def test_shared_session(self):
+        session = Session()
+        adapter = ScriptedAdapter([200, 200])
+        session.mount('http://', adapter)
+
+        ContentService(url='http://content', apikey='one', session=session).checkassets({})
+        ContentService(url='http://content', apikey='two', session=session).checkassets({})
+
+        assert_equal([h['Authorization'] for h in adapter.headers], ['deconst one', 'deconst two'])
+        assert_equal(adapter.headers[0]['Content-Type'], 'application/json')
+
+class EchoAdapter(BaseAdapter):
+    """
+    A transport adapter that answers a check query by marking every entry it
+    contains as present.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+
+    def send(self, request, **kwargs):
+        query = json.loads(request.body.decode('utf-8'))
+        self.queries.append(query)
+
+        response = Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(json.dumps({k: True for k in query}).encode('utf-8'))
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+class TestContentServiceShards():
+
+    def service(self, shard_size):
+        session = Session()
+        adapter = EchoAdapter()
+        session.mount('http://', adapter)
+        cs = ContentService(url='http://content', apikey=APIKEY, session=session,
+                            shard_size=shard_size, check_workers=3)
+        return cs, adapter
+
+    def test_sharded_query(self):
+        cs, adapter = self.service(4)
+        query = {'content/{}'.format(i): 'fingerprint' for i in range(10)}
+
+        response = cs.checkcontent(query)
+
+        assert_equal(response, {k: True for k in query})
+        assert_equal(sorted(len(q) for q in adapter.queries), [2, 4, 4])
+
+    def test_small_query_is_not_sharded(self):
+        cs, adapter = self.service(4)
+        query = {'a.jpg': 'fingerprint', 'b.jpg': 'fingerprint'}
+
+        assert_equal(cs.checkassets(query), {'a.jpg': True, 'b.jpg': True})
+        assert_equal(adapter.queries, [query])
+
 def add_tar_entry(tf, entryname, buf = b''):
     """
     Add a manually constructed TarInfo to a TarFile.
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+from os.path import join, relpath
+
+from nose.tools import assert_equal, assert_true
+
+from submitter.discovery import scan_files, matches
+
+class TestScanFiles():
+
+    def setup(self):
+        self.root = tempfile.mkdtemp()
+        for path in (
+            'index.css',
+            '.DS_Store',
+            'images/logo.png',
+            'images/.DS_Store',
+            'js/app.js',
+            'js/app.js.map',
+            'js/vendor/lib.js',
+            'node_modules/pkg/index.js'
+        ):
+            fullpath = join(self.root, path)
+            os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+            with open(fullpath, 'w') as f:
+                f.write(path)
+
+    def teardown(self):
+        shutil.rmtree(self.root)
+
+    def test_matches_os_walk(self):
+        walked = []
+        for root, dirs, files in os.walk(self.root):
+            for fname in files:
+                walked.append(relpath(join(root, fname), self.root))
+
+        assert_equal([e.localpath for e in scan_files(self.root)], walked)
+
+    def test_stat(self):
+        for entry in scan_files(self.root):
+            st = os.stat(entry.fullpath)
+            assert_equal(entry.size, st.st_size)
+            assert_equal(entry.size, len(entry.localpath))
+            assert_equal(entry.mtime_ns, st.st_mtime_ns)
+
+    def test_exclude(self):
+        found = sorted(e.localpath for e in scan_files(
+            self.root, exclude=('.DS_Store', '*.map', 'node_modules')
+        ))
+
+        assert_equal(found, ['images/logo.png', 'index.css', 'js/app.js', 'js/vendor/lib.js'])
+
+    def test_include(self):
+        found = sorted(e.localpath for e in scan_files(self.root, include=('*.js',), exclude=('js/vendor',)))
+
+        assert_equal(found, ['js/app.js', 'node_modules/pkg/index.js'])
+
+def test_matches():
+    assert_true(matches('a/b/.DS_Store', '.DS_Store', ('.DS_Store',)))
+    assert_true(matches('js/vendor', 'vendor', ('js/*',)))
+    assert_equal(matches('css/vendor', 'vendor', ('js/*',)), False)
@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 
 import io
+import hashlib
 
-from nose.tools import assert_equal, assert_in, assert_not_in, \
-    assert_true, assert_false
+from nose.tools import assert_equal, assert_not_equal, assert_in, \
+    assert_not_in, assert_true, assert_false, assert_logs
 
 from submitter.asset import Asset, AssetSet
 from submitter.envelope import Envelope, EnvelopeSet
@@ -57,6 +58,46 @@ class TestEnvelope():
             'https://assets.horse/three-333.png some ' \
             'assets https://assets.horse/one-111.jpg</p>')
 
+    def test_apply_offsets_out_of_range(self):
+        asset_set = AssetSet()
+        asset_set.append(Asset('local/one.jpg', io.BytesIO()))
+        asset_set.accept_urls({'local/one.jpg': 'https://assets.horse/one-111.jpg'})
+
+        data = io.StringIO('''{
+            "body": "X and X",
+            "asset_offsets": { "local/one.jpg": [0, 6, 7, -1] }
+        }''')
+        e = Envelope('page.json', data)
+
+        with assert_logs(level='WARNING') as logs:
+            e.apply_asset_offsets(asset_set)
+
+        assert_equal(len(logs.output), 2)
+        assert_equal(e.document['body'], 'https://assets.horse/one-111.jpg and ' \
+            'https://assets.horse/one-111.jpg')
+
+    def test_apply_offsets_collision(self):
+        asset_set = AssetSet()
+        asset_set.append(Asset('local/one.jpg', io.BytesIO()))
+        asset_set.append(Asset('local/two.gif', io.BytesIO()))
+        asset_set.accept_urls({
+            'local/one.jpg': 'https://assets.horse/one-111.jpg',
+            'local/two.gif': 'https://assets.horse/two-222.gif'
+        })
+
+        data = io.StringIO('''{
+            "body": "<X>",
+            "asset_offsets": { "local/one.jpg": [1], "local/two.gif": [1] }
+        }''')
+        e = Envelope('page.json', data)
+
+        with assert_logs(level='WARNING') as logs:
+            e.apply_asset_offsets(asset_set)
+
+        assert_equal(len(logs.output), 1)
+        assert_in('claimed more than once, by local/one.jpg, local/two.gif', logs.output[0])
+        assert_equal(e.document['body'], '<https://assets.horse/two-222.gif>')
+
     def test_fingerprint(self):
         a = Asset('local/one.jpg', io.BytesIO())
         asset_set = AssetSet()
@@ -77,6 +118,99 @@ class TestEnvelope():
         # echo -n '{"body":"<p>The asset URL is https://assets.horse/one-111.jpg</p>","title":"another asset envelope"}' | shasum -a 256
         assert_equal(e.fingerprint(), 'a0e0c4043590530b1d911432c04fc4d238c614b60eeaa9b68632d0791ba96aec')
 
+    def test_asset_context(self):
+        a0 = Asset('local/one.jpg', io.BytesIO())
+        a1 = Asset('local/two.gif', io.BytesIO())
+        asset_set = AssetSet()
+        asset_set.append(a0)
+        asset_set.append(a1)
+        asset_set.accept_urls({
+            'local/one.jpg': 'https://assets.horse/one-111.jpg',
+            'local/two.gif': 'https://assets.horse/two-222.gif'
+        })
+
+        plain = Envelope('page.json', io.StringIO('{"body": "no assets"}'))
+        assert_equal(plain.asset_context(asset_set), '')
+
+        data = '{"body": "X", "asset_offsets": {"local/one.jpg": [0]}}'
+        e = Envelope('page.json', io.StringIO(data))
+        before = e.asset_context(asset_set)
+
+        # Changing an unrelated asset's URL does not change the context.
+        a1.public_url = 'https://assets.horse/two-333.gif'
+        assert_equal(e.asset_context(asset_set), before)
+
+        a0.public_url = 'https://assets.horse/one-444.jpg'
+        assert_not_equal(e.asset_context(asset_set), before)
+
+    def test_reuse_fingerprint(self):
+        e = Envelope('page.json', io.StringIO('{"body": "a"}'))
+        e.reuse_fingerprint('abc123')
+        assert_equal(e.fingerprint(), 'abc123')
+
+    def test_encode_once(self):
+        a = Asset('local/one.jpg', io.BytesIO())
+        asset_set = AssetSet()
+        asset_set.append(a)
+        asset_set.accept_urls({
+            'local/one.jpg': 'https://assets.horse/one-111.jpg'
+        })
+
+        data = io.StringIO('''{
+            "title": "another asset envelope",
+            "body": "<p>The asset URL is X</p>",
+            "asset_offsets": { "local/one.jpg": [20] }
+        }''')
+        e = Envelope('https%3A%2F%2Fgithub.com%2Forg%2Frepo%2Fpage.json', data)
+        e.apply_asset_offsets(asset_set)
+
+        encoded = e.encode()
+        assert_equal(encoded, '{"body":"<p>The asset URL is https://assets.horse/one-111.jpg</p>",' \
+            '"title":"another asset envelope"}'.encode('utf-8'))
+        assert_equal(e.fingerprint(), hashlib.sha256(encoded).hexdigest())
+
+        # The same buffer is reused, and the document is parsed back on demand.
+        assert_true(e.encode() is encoded)
+        assert_equal(e.serialize(), encoded.decode('utf-8'))
+        assert_equal(e.document['title'], 'another asset envelope')
+
+    def test_encode_before_offsets(self):
+        data = io.StringIO('{"body": "X", "asset_offsets": {"local/one.jpg": [0]}}')
+        e = Envelope('page.json', data)
+        e.encode()
+
+        # Offsets have not been applied yet, so the document is kept.
+        assert_in('asset_offsets', e.document)
+
+        asset_set = AssetSet()
+        asset_set.append(Asset('local/one.jpg', io.BytesIO()))
+        asset_set.accept_urls({'local/one.jpg': 'https://assets.horse/one-111.jpg'})
+        e.apply_asset_offsets(asset_set)
+
+        assert_equal(e.encode(), b'{"body":"https://assets.horse/one-111.jpg"}')
+
+    def test_release_keeps_fingerprint(self):
+        asset_set = AssetSet()
+        asset_set.append(Asset('foo/aaa.jpg', io.BytesIO()))
+        asset_set.append(Asset('bar/bbb.gif', io.BytesIO()))
+        asset_set.accept_urls({
+            'foo/aaa.jpg': 'https://assets.horse/aaa-111.jpg',
+            'bar/bbb.gif': 'https://assets.horse/bbb-222.gif'
+        })
+
+        fname = 'test/fixtures/envelopes/https%3A%2F%2Fgithub.com%2Forg%2Frepo%2Fone.json'
+        with open(fname, 'r') as ef:
+            e = Envelope(fname, ef)
+        e.apply_asset_offsets(asset_set)
+        fingerprint = e.fingerprint()
+        e.release()
+
+        # Reading the envelope again for an upload keeps its fingerprint.
+        e.load(asset_set)
+        assert_equal(hashlib.sha256(e.encode()).hexdigest(), fingerprint)
+        e.release()
+        assert_equal(e.fingerprint(), fingerprint)
+
     def test_accept_presence(self):
         data = io.StringIO('{"title": "a", "body":"a"}')
         e = Envelope('https%3A%2F%2Fgithub.com%2Forg%2Frepo%2Fpage.json', data)
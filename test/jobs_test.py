@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+
+from nose.tools import assert_equal, assert_not_equal, assert_raises, assert_true
+
+from . import run
+from bench.fake_service import FakeContentService
+from bench.trees import TreeSpec, CONTENT_ID_BASE, generate_tree
+from submitter.jobs import load_jobs, job_configs, submit_jobs, aggregate_state, JobResult
+from submitter.submit import SubmitResult, SUCCESS, NOOP, FAILURE
+
+ENV = {
+    'CONTENT_SERVICE_URL': 'http://localhost:9000',
+    'CONTENT_SERVICE_APIKEY': '12341234',
+    'SUBMITTER_MANIFEST': '/var/cache/submitter/manifest.json'
+}
+
+JOBS = [
+    {
+        'ENVELOPE_DIR': 'test/fixtures/envelopes/',
+        'ASSET_DIR': 'test/fixtures/assets/',
+        'CONTENT_ID_BASE': 'https://github.com/org/repo/'
+    },
+    {
+        'ENVELOPE_DIR': 'test/fixtures/envelopes/',
+        'ASSET_DIR': 'test/fixtures/assets/',
+        'CONTENT_ID_BASE': 'https://github.com/org/other/',
+        'ASSET_HASH_WORKERS': 2
+    }
+]
+
+class TestJobs():
+
+    def setup(self):
+        self.workspace = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.workspace)
+
+    def test_load_jobs(self):
+        path = os.path.join(self.workspace, 'jobs.json')
+        with open(path, 'w') as jf:
+            json.dump(JOBS, jf)
+
+        assert_equal(load_jobs(path), JOBS)
+
+        with open(path, 'w') as jf:
+            json.dump({'jobs': JOBS}, jf)
+
+        assert_raises(ValueError, load_jobs, path)
+
+    def test_job_configs(self):
+        first, second = job_configs(ENV, JOBS)
+
+        assert_true(first.is_valid())
+        assert_true(second.is_valid())
+        assert_equal(first.content_id_base, 'https://github.com/org/repo/')
+        assert_equal(second.hash_workers, 2)
+        assert_equal(second.content_service_url, 'http://localhost:9000')
+
+        # Each job gets its own manifest.
+        assert_not_equal(first.manifest, second.manifest)
+        assert_true(first.manifest.startswith('/var/cache/submitter/manifest-'))
+        assert_true(first.manifest.endswith('.json'))
+
+    def test_submit_jobs(self):
+        service = FakeContentService()
+        asset_dir, envelope_dir = generate_tree(self.workspace, TreeSpec(assets=4, envelopes=3, body_size=100))
+        jobs = [JOBS[0], {'ENVELOPE_DIR': envelope_dir, 'ASSET_DIR': asset_dir, 'CONTENT_ID_BASE': CONTENT_ID_BASE}]
+        configs = job_configs(dict(ENV, SUBMITTER_MANIFEST=''), jobs)
+
+        results = run(submit_jobs(configs, service.session('http://localhost:9000')))
+
+        assert_equal([r.state for r in results], [SUCCESS, SUCCESS])
+        assert_equal(results[1].result.envelope_result.uploaded, 3)
+        assert_equal(aggregate_state(results), SUCCESS)
+        assert_equal(results[1].result.asset_result.uploaded, 4)
+        assert_equal(len(service.envelopes), 6)
+
+        results = run(submit_jobs(configs, service.session('http://localhost:9000')))
+        assert_equal(aggregate_state(results), NOOP)
+
+    def test_failed_job(self):
+        service = FakeContentService()
+
+        # The envelopes refer to assets that aren't in this directory.
+        jobs = [JOBS[0], dict(JOBS[1], ASSET_DIR='test/fixtures/batched_assets/')]
+        configs = job_configs(dict(ENV, SUBMITTER_MANIFEST=''), jobs)
+        results = run(submit_jobs(configs, service.session('http://localhost:9000')))
+
+        assert_equal(results[0].state, SUCCESS)
+        assert_equal(results[1].state, FAILURE)
+        assert_true(isinstance(results[1].error, KeyError))
+        assert_equal(aggregate_state(results), FAILURE)
+
+def test_aggregate_state():
+    def job(state):
+        return JobResult(None, result=SubmitResult(None, None, state))
+
+    assert_equal(aggregate_state([job(NOOP), job(NOOP)]), NOOP)
+    assert_equal(aggregate_state([job(NOOP), job(SUCCESS)]), SUCCESS)
+    assert_equal(aggregate_state([job(SUCCESS), job(FAILURE)]), FAILURE)
+    assert_equal(aggregate_state([job(SUCCESS), JobResult(None, error=Exception())]), FAILURE)
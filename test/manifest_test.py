@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import shutil
+import tempfile
+
+from nose.tools import assert_equal, assert_is_none, assert_true, assert_false
+
+from submitter.asset import Asset, AssetSet
+from submitter.envelope import EnvelopeSet
+from submitter.manifest import Manifest
+
+URL = 'http://localhost:9000'
+BASE = 'https://github.com/org/repo/'
+
+class TestManifest():
+
+    def setup(self):
+        self.workspace = tempfile.mkdtemp()
+        self.path = os.path.join(self.workspace, 'manifest.json')
+
+    def teardown(self):
+        shutil.rmtree(self.workspace)
+
+    def _recorded(self):
+        asset_set = AssetSet()
+        asset_set.append(Asset('foo/aaa.jpg', io.BytesIO(b'aaa')))
+        asset_set.append(Asset('bar/bbb.gif', io.BytesIO(b'bbb')))
+        asset_set.accept_urls({'foo/aaa.jpg': '/assets/aaa.jpg'})
+
+        manifest = Manifest(self.path, URL, BASE)
+        manifest.record(asset_set, EnvelopeSet())
+        manifest.envelopes = {BASE + 'one': 'fp1'}
+        manifest.save()
+        return asset_set
+
+    def test_missing(self):
+        manifest = Manifest(self.path, URL, BASE)
+        manifest.load()
+
+        assert_equal(manifest.assets, {})
+        assert_equal(manifest.envelopes, {})
+
+    def test_roundtrip(self):
+        asset_set = self._recorded()
+        aaa = [a for a in asset_set.all() if a.localpath == 'foo/aaa.jpg'][0]
+
+        manifest = Manifest(self.path, URL, BASE)
+        manifest.load()
+
+        # Only assets with a public URL are recorded.
+        assert_equal(list(manifest.assets.keys()), ['foo/aaa.jpg'])
+        assert_equal(manifest.known_url('foo/aaa.jpg', aaa.fingerprint), '/assets/aaa.jpg')
+        assert_is_none(manifest.known_url('foo/aaa.jpg', 'changed'))
+        assert_is_none(manifest.known_url('bar/bbb.gif', aaa.fingerprint))
+
+        assert_true(manifest.known_present(BASE + 'one', 'fp1'))
+        assert_false(manifest.known_present(BASE + 'one', 'fp2'))
+        assert_false(manifest.known_present(BASE + 'two', 'fp1'))
+
+    def test_same_envelopes(self):
+        # A manifest that was never recorded can't vouch for anything.
+        manifest = Manifest(self.path, URL, BASE)
+        manifest.load()
+        assert_false(manifest.same_envelopes([]))
+
+        self._recorded()
+        manifest.load()
+        assert_true(manifest.same_envelopes([BASE + 'one']))
+        assert_false(manifest.same_envelopes([]))
+        assert_false(manifest.same_envelopes([BASE + 'one', BASE + 'two']))
+
+    def test_different_target(self):
+        self._recorded()
+
+        manifest = Manifest(self.path, 'http://elsewhere:9000', BASE)
+        manifest.load()
+        assert_equal(manifest.assets, {})
+
+        manifest = Manifest(self.path, URL, 'https://github.com/org/other/')
+        manifest.load()
+        assert_equal(manifest.envelopes, {})
+
+    def test_unreadable(self):
+        with open(self.path, 'w') as mf:
+            mf.write('{not json')
+
+        manifest = Manifest(self.path, URL, BASE)
+        manifest.load()
+        assert_equal(manifest.assets, {})
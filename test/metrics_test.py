@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+
+from nose.tools import assert_equal, assert_in, assert_true
+
+from submitter.metrics import Metrics
+
+class TestMetrics():
+
+    def setup(self):
+        self.workspace = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.workspace)
+
+    def test_phase_accumulates(self):
+        metrics = Metrics()
+
+        with metrics.phase('hashing', items=2, nbytes=100):
+            pass
+        with metrics.phase('hashing') as m:
+            m.items = 3
+            m.bytes = 50
+
+        phase = metrics.phases['hashing']
+        assert_equal(phase.calls, 2)
+        assert_equal(phase.items, 5)
+        assert_equal(phase.bytes, 150)
+        assert_true(phase.seconds >= 0)
+        assert_true(phase.cpu_seconds >= 0)
+
+    def test_phase_records_failures(self):
+        metrics = Metrics()
+
+        try:
+            with metrics.phase('check_assets', items=4):
+                raise RuntimeError('boom')
+        except RuntimeError:
+            pass
+
+        assert_equal(metrics.phases['check_assets'].calls, 1)
+        assert_equal(metrics.phases['check_assets'].items, 4)
+
+    def test_write_json(self):
+        metrics = Metrics()
+        with metrics.phase('discovery', items=7):
+            pass
+        metrics.gauge('retries', 2)
+
+        path = os.path.join(self.workspace, 'metrics.json')
+        metrics.write(path)
+
+        with open(path, 'r') as mf:
+            doc = json.load(mf)
+
+        assert_equal(doc['phases']['discovery']['items'], 7)
+        assert_equal(doc['phases']['discovery']['calls'], 1)
+        assert_equal(doc['gauges'], {'retries': 2})
+
+    def test_prometheus(self):
+        metrics = Metrics()
+        with metrics.phase('asset_upload', items=3, nbytes=1024):
+            pass
+        metrics.gauge('retries', 0)
+
+        text = metrics.to_prometheus()
+
+        assert_in('# TYPE submitter_phase_seconds gauge', text)
+        assert_in('submitter_phase_items{phase="asset_upload"} 3', text)
+        assert_in('submitter_phase_bytes{phase="asset_upload"} 1024', text)
+        assert_in('submitter_retries 0', text)
+        assert_true(text.endswith('\n'))
@@ -1,17 +1,23 @@
 # -*- coding: utf-8 -*-
 
 import io
+import json
+import os
+import shutil
+import tempfile
 
 from betamax import Betamax
 from requests import Session
-from nose.tools import assert_is_not_none, assert_equal, assert_true
+from nose.tools import assert_is_not_none, assert_is_none, assert_equal, assert_true, assert_in
 
-from . import URL, APIKEY
+from . import URL, APIKEY, run
 from submitter.config import Config
 from submitter.asset import AssetSet, Asset
+from submitter.cache import FingerprintCache
 from submitter.content_service import ContentService
-from submitter.submit import submit, submit_assets, submit_envelopes, \
-    SUCCESS, NOOP
+from bench.fake_service import FakeContentService
+from submitter.submit import submit, submit_async, submit_assets, submit_envelopes, \
+    discover_assets, SUCCESS, NOOP
 
 CONFIG = Config({
     'ENVELOPE_DIR': 'test/fixtures/envelopes/',
@@ -21,6 +27,20 @@ CONFIG = Config({
     'CONTENT_ID_BASE': 'https://github.com/org/repo/'
 })
 
+def _public_asset_set():
+    """
+    Return an AssetSet of the fixture assets, both already public.
+    """
+
+    asset_set = AssetSet()
+    asset_set.append(Asset('foo/aaa.jpg', io.BytesIO()))
+    asset_set.append(Asset('bar/bbb.gif', io.BytesIO()))
+    asset_set.accept_urls({
+        'foo/aaa.jpg': '/__local_asset__/aaa-e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855.jpg',
+        'bar/bbb.gif': '/__local_asset__/bbb-e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855.gif'
+    })
+    return asset_set
+
 class TestSubmit():
 
     def setup(self):
@@ -56,20 +76,96 @@ class TestSubmit():
         with self.betamax.use_cassette('test_submit_assets_batches'):
             result = submit_assets('test/fixtures/batched_assets', 25000, self.cs)
 
+            assert_equal(result.uploaded, 4)
+            assert_equal(result.batches, 2)
+            assert_equal(result.batch_sizes, [21504, 21504])
+            assert_equal(result.present, 0)
+
+    def test_submit_assets_duplicates(self):
+        workspace = tempfile.mkdtemp()
+        try:
+            for section in ('one', 'two', 'three'):
+                os.makedirs(os.path.join(workspace, section))
+                with open(os.path.join(workspace, section, 'logo.png'), 'wb') as af:
+                    af.write(b'the same logo everywhere')
+                with open(os.path.join(workspace, section, 'page.png'), 'wb') as af:
+                    af.write(section.encode('utf-8'))
+
+            service = FakeContentService()
+            cs = ContentService(url=URL, apikey=APIKEY, session=service.session(URL))
+            result = submit_assets(workspace, 10000, cs)
+        finally:
+            shutil.rmtree(workspace)
+
+        assert_equal(result.uploaded, 4)
+        assert_equal(result.deduplicated, 2)
+        assert_equal(result.bytes_saved, 2 * len(b'the same logo everywhere'))
+        assert_equal(result.present, 0)
+
+        # Every copy shares the public URL of the one that was uploaded.
+        urls = result.asset_set.public_urls()
+        assert_equal(urls['one/logo.png'], urls['two/logo.png'])
+        assert_equal(urls['one/logo.png'], urls['three/logo.png'])
+        assert_true(result.asset_set.all_public())
+
+    def test_submit_assets_hash_workers(self):
+        with self.betamax.use_cassette('test_submit_assets'):
+            result = submit_assets('test/fixtures/assets', 10000, self.cs, hash_workers=4)
+
+            assert_equal(result.uploaded, 2)
+            assert_equal(result.present, 0)
+
+    def test_submit_assets_streaming(self):
+        with self.betamax.use_cassette('test_submit_assets_batches'):
+            result = submit_assets('test/fixtures/batched_assets', 25000, self.cs, streaming=True)
+
+            assert_equal(result.uploaded, 4)
+            assert_equal(result.batches, 2)
+            assert_equal(result.present, 0)
+            assert_true(result.asset_set.all_public())
+
+    def test_submit_assets_upload_workers(self):
+        with self.betamax.use_cassette('test_submit_assets_batches'):
+            result = submit_assets('test/fixtures/batched_assets', 25000, self.cs, upload_workers=2)
+
             assert_equal(result.uploaded, 4)
             assert_equal(result.batches, 2)
             assert_equal(result.present, 0)
+            assert_true(result.asset_set.all_public())
+
+    def test_discover_assets_order(self):
+        serial = discover_assets('test/fixtures/batched_assets')
+        parallel = discover_assets('test/fixtures/batched_assets', hash_workers=3)
+
+        assert_equal(
+            [a.localpath for a in parallel.all()],
+            [a.localpath for a in serial.all()]
+        )
+        assert_equal(parallel.fingerprint_query(), serial.fingerprint_query())
+
+    def test_discover_assets_cache(self):
+        workspace = tempfile.mkdtemp()
+        try:
+            cache_path = os.path.join(workspace, 'fingerprints.db')
+
+            cache = FingerprintCache(cache_path)
+            first = discover_assets('test/fixtures/batched_assets', cache=cache)
+            assert_equal(cache.hits, 0)
+            assert_equal(cache.misses, 4)
+            cache.save()
+
+            cache = FingerprintCache(cache_path)
+            second = discover_assets('test/fixtures/batched_assets', cache=cache)
+            assert_equal(cache.hits, 4)
+            assert_equal(cache.misses, 0)
+
+            assert_equal(second.fingerprint_query(), first.fingerprint_query())
+        finally:
+            shutil.rmtree(workspace)
 
     def test_submit_envelopes(self):
         with self.betamax.use_cassette('test_submit_envelopes'):
-            asset_set = AssetSet()
-            asset_set.append(Asset('foo/aaa.jpg', io.BytesIO()))
-            asset_set.append(Asset('bar/bbb.gif', io.BytesIO()))
-
-            asset_set.accept_urls({
-                'foo/aaa.jpg': '/__local_asset__/aaa-e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855.jpg',
-                'bar/bbb.gif': '/__local_asset__/bbb-e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855.gif'
-            })
+            asset_set = _public_asset_set()
 
             result = submit_envelopes(
                 'test/fixtures/envelopes',
@@ -97,6 +193,136 @@ class TestSubmit():
             assert_is_not_none(two)
             assert_is_not_none(three)
 
+    def test_submit_envelopes_workers(self):
+        asset_set = _public_asset_set()
+
+        fingerprints = []
+        for workers in (1, 2):
+            with self.betamax.use_cassette('test_submit_envelopes'):
+                result = submit_envelopes(
+                    'test/fixtures/envelopes',
+                    asset_set,
+                    'https://github.com/org/repo/',
+                    self.cs,
+                    envelope_workers=workers
+                )
+            assert_equal(result.uploaded, 3)
+            fingerprints.append(result.envelope_set.fingerprint_query())
+
+        assert_equal(fingerprints[0], fingerprints[1])
+
+    def test_submit_envelopes_streaming(self):
+        asset_set = _public_asset_set()
+
+        with self.betamax.use_cassette('test_submit_envelopes'):
+            streamed = submit_envelopes(
+                'test/fixtures/envelopes', asset_set, 'https://github.com/org/repo/', self.cs, streaming=True
+            )
+        with self.betamax.use_cassette('test_submit_envelopes'):
+            buffered = submit_envelopes(
+                'test/fixtures/envelopes', asset_set, 'https://github.com/org/repo/', self.cs
+            )
+
+        assert_equal(streamed.uploaded, 3)
+        assert_equal(streamed.envelope_set.fingerprint_query(), buffered.envelope_set.fingerprint_query())
+
+        # Only fingerprints are retained.
+        for envelope in streamed.envelope_set.all():
+            assert_is_none(envelope._document)
+            assert_is_none(envelope._encoded)
+
+    def test_submit_envelopes_batches(self):
+        asset_set = _public_asset_set()
+
+        service = FakeContentService()
+        service.envelopes['https://github.com/org/repo/stale'] = '0' * 64
+        cs = ContentService(url=URL, apikey=APIKEY, session=service.session(URL))
+
+        result = submit_envelopes(
+            'test/fixtures/envelopes', asset_set, 'https://github.com/org/repo/', cs, batch_size=1
+        )
+
+        assert_equal(service.requests['/bulkcontent'], 3)
+        assert_equal(result.uploaded, 3)
+        assert_equal(result.deleted, 1)
+        assert_equal(result.failed, 0)
+
+        # No batch deleted the envelopes uploaded by another.
+        assert_equal(sorted(service.envelopes), [
+            'https://github.com/org/repo/one',
+            'https://github.com/org/repo/three',
+            'https://github.com/org/repo/two'
+        ])
+
+    def test_submit_envelopes_cache(self):
+        asset_set = _public_asset_set()
+
+        workspace = tempfile.mkdtemp()
+        try:
+            cache = FingerprintCache(os.path.join(workspace, 'fingerprints.db'))
+
+            fingerprints = []
+            for workers in (1, 1, 2):
+                with self.betamax.use_cassette('test_submit_envelopes'):
+                    result = submit_envelopes(
+                        'test/fixtures/envelopes',
+                        asset_set,
+                        'https://github.com/org/repo/',
+                        self.cs,
+                        cache=cache,
+                        envelope_workers=workers
+                    )
+                fingerprints.append(result.envelope_set.fingerprint_query())
+
+            assert_equal(cache.misses, 3)
+            assert_equal(cache.hits, 6)
+            assert_equal(fingerprints[0], fingerprints[1])
+            assert_equal(fingerprints[0], fingerprints[2])
+        finally:
+            shutil.rmtree(workspace)
+
+    def test_submit_envelopes_cache_unread(self):
+        asset_set = _public_asset_set()
+
+        workspace = tempfile.mkdtemp()
+        try:
+            envelope_dir = os.path.join(workspace, 'envelopes')
+            shutil.copytree('test/fixtures/envelopes', envelope_dir)
+
+            service = FakeContentService()
+            cs = ContentService(url=URL, apikey=APIKEY, session=service.session(URL))
+            cache = FingerprintCache(os.path.join(workspace, 'fingerprints.db'))
+            first = submit_envelopes(envelope_dir, asset_set, 'https://github.com/org/repo/', cs, cache=cache)
+            cache.save()
+
+            # Garble each envelope without changing its size, mtime or inode.
+            # Reading any of them again would fail.
+            for name in os.listdir(envelope_dir):
+                path = os.path.join(envelope_dir, name)
+                st = os.stat(path)
+                with open(path, 'r+b') as ef:
+                    ef.write(b'x' * st.st_size)
+                os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+            for workers, streaming in ((1, False), (2, False), (1, True)):
+                cache = FingerprintCache(os.path.join(workspace, 'fingerprints.db'))
+                result = submit_envelopes(
+                    envelope_dir,
+                    asset_set,
+                    'https://github.com/org/repo/',
+                    cs,
+                    cache=cache,
+                    envelope_workers=workers,
+                    streaming=streaming
+                )
+
+                assert_equal(cache.hits, 3)
+                assert_equal(cache.misses, 0)
+                assert_equal(result.uploaded, 0)
+                assert_equal(result.envelope_set.fingerprint_query(), first.envelope_set.fingerprint_query())
+        finally:
+            shutil.rmtree(workspace)
+
     def test_submit_success(self):
         # Record this one with an empty content service.
         with self.betamax.use_cassette('test_submit_success'):
@@ -110,6 +336,56 @@ class TestSubmit():
             assert_equal(result.envelope_result.failed, 0)
             assert_equal(result.state, SUCCESS)
 
+            phases = result.metrics.phases
+            for name in ('submit', 'discovery', 'hashing', 'check_assets', 'asset_archive',
+                         'asset_upload', 'envelope_parse', 'envelope_serialize', 'check_content',
+                         'envelope_archive', 'envelope_upload'):
+                assert_in(name, phases)
+            assert_equal(phases['hashing'].items, 2)
+            assert_equal(phases['envelope_archive'].items, 3)
+            assert_equal(result.metrics.gauges['envelopes_uploaded'], 3)
+
+    def test_submit_async(self):
+        with self.betamax.use_cassette('test_submit_success'):
+            result = run(submit_async(CONFIG, self.session))
+
+            assert_equal(result.asset_result.uploaded, 2)
+            assert_equal(result.asset_result.present, 0)
+            assert_equal(result.envelope_result.uploaded, 3)
+            assert_equal(result.envelope_result.present, 0)
+            assert_equal(result.envelope_result.failed, 0)
+            assert_equal(result.state, SUCCESS)
+
+    def test_submit_async_duplicates(self):
+        workspace = tempfile.mkdtemp()
+        try:
+            asset_dir = os.path.join(workspace, 'assets')
+            envelope_dir = os.path.join(workspace, 'envelopes')
+            os.makedirs(envelope_dir)
+            for section in ('one', 'two', 'three'):
+                os.makedirs(os.path.join(asset_dir, section))
+                with open(os.path.join(asset_dir, section, 'logo.png'), 'wb') as af:
+                    af.write(b'the same logo everywhere')
+
+            config = Config({
+                'ENVELOPE_DIR': envelope_dir,
+                'ASSET_DIR': asset_dir,
+                'CONTENT_SERVICE_URL': URL,
+                'CONTENT_SERVICE_APIKEY': APIKEY,
+                'CONTENT_ID_BASE': 'https://github.com/org/repo/',
+                'ASSET_UPLOAD_WORKERS': '2'
+            })
+            service = FakeContentService()
+            result = run(submit_async(config, service.session(URL)))
+        finally:
+            shutil.rmtree(workspace)
+
+        assert_equal(result.asset_result.uploaded, 1)
+        assert_equal(result.asset_result.deduplicated, 2)
+        assert_equal(result.asset_result.bytes_saved, 2 * len(b'the same logo everywhere'))
+        assert_equal(result.asset_result.present, 0)
+        assert_true(result.asset_result.asset_set.all_public())
+
     def test_submit_noop(self):
         # Record this one with an empty content service.
         with self.betamax.use_cassette('test_submit_noop'):
@@ -122,3 +398,104 @@ class TestSubmit():
             assert_equal(result.envelope_result.deleted, 0)
             assert_equal(result.envelope_result.failed, 0)
             assert_equal(result.state, NOOP)
+
+    def test_submit_manifest(self):
+        workspace = tempfile.mkdtemp()
+        try:
+            config = Config({
+                'ENVELOPE_DIR': 'test/fixtures/envelopes/',
+                'ASSET_DIR': 'test/fixtures/assets/',
+                'CONTENT_SERVICE_URL': URL,
+                'CONTENT_SERVICE_APIKEY': APIKEY,
+                'CONTENT_ID_BASE': 'https://github.com/org/repo/',
+                'SUBMITTER_MANIFEST': os.path.join(workspace, 'manifest.json')
+            })
+
+            paths = []
+            self.session.hooks['response'].append(
+                lambda response, *args, **kwargs: paths.append(response.request.path_url)
+            )
+
+            with self.betamax.use_cassette('test_submit_noop'):
+                result = submit(config, self.session)
+            assert_equal(result.state, NOOP)
+            assert_true(os.path.exists(config.manifest))
+
+            # Nothing has changed, so the second run doesn't need to check or
+            # upload anything.
+            del paths[:]
+            with self.betamax.use_cassette('test_submit_noop'):
+                result = submit(config, self.session)
+
+            assert_equal(paths, [])
+            assert_equal(result.asset_result.present, 2)
+            assert_equal(result.envelope_result.present, 3)
+            assert_equal(result.state, NOOP)
+        finally:
+            shutil.rmtree(workspace)
+
+    def test_submit_streaming_manifest(self):
+        for workers in ('1', '2'):
+            workspace = tempfile.mkdtemp()
+            try:
+                config = Config({
+                    'ENVELOPE_DIR': 'test/fixtures/envelopes/',
+                    'ASSET_DIR': 'test/fixtures/assets/',
+                    'CONTENT_SERVICE_URL': URL,
+                    'CONTENT_SERVICE_APIKEY': APIKEY,
+                    'CONTENT_ID_BASE': 'https://github.com/org/repo/',
+                    'ENVELOPE_STREAMING': '1',
+                    'ENVELOPE_WORKERS': workers,
+                    'SUBMITTER_MANIFEST': os.path.join(workspace, 'manifest.json')
+                })
+                service = FakeContentService()
+
+                # Uploaded envelopes with asset offsets are read again and
+                # released, and the manifest records their fingerprints after.
+                result = submit(config, service.session(URL))
+                assert_equal(result.state, SUCCESS)
+                assert_equal(result.envelope_result.uploaded, 3)
+
+                with open(config.manifest, 'r') as mf:
+                    recorded = json.load(mf)['envelopes']
+                assert_equal(recorded, service.envelopes)
+
+                assert_equal(submit(config, service.session(URL)).state, NOOP)
+            finally:
+                shutil.rmtree(workspace)
+
+    def test_submit_manifest_removed_envelope(self):
+        workspace = tempfile.mkdtemp()
+        try:
+            envelope_dir = os.path.join(workspace, 'envelopes')
+            shutil.copytree('test/fixtures/envelopes', envelope_dir)
+            config = Config({
+                'ENVELOPE_DIR': envelope_dir,
+                'ASSET_DIR': 'test/fixtures/assets/',
+                'CONTENT_SERVICE_URL': URL,
+                'CONTENT_SERVICE_APIKEY': APIKEY,
+                'CONTENT_ID_BASE': 'https://github.com/org/repo/',
+                'SUBMITTER_MANIFEST': os.path.join(workspace, 'manifest.json')
+            })
+            service = FakeContentService()
+
+            assert_equal(submit(config, service.session(URL)).state, SUCCESS)
+            assert_equal(submit(config, service.session(URL)).state, NOOP)
+            assert_equal(service.requests['/bulkcontent'], 1)
+
+            # A removed envelope must still be deleted from the content service.
+            for fname in os.listdir(envelope_dir):
+                if fname.endswith('two.json'):
+                    os.remove(os.path.join(envelope_dir, fname))
+
+            result = submit(config, service.session(URL))
+            assert_equal(result.state, NOOP)
+            assert_equal(result.envelope_result.deleted, 1)
+            assert_equal(service.requests['/bulkcontent'], 2)
+            assert_equal(len(service.envelopes), 2)
+
+            # The manifest now matches again.
+            assert_equal(submit(config, service.session(URL)).state, NOOP)
+            assert_equal(service.requests['/bulkcontent'], 2)
+        finally:
+            shutil.rmtree(workspace)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from nose.tools import assert_equal, assert_is_none, assert_true
+
+from bench.fake_service import FakeContentService
+from bench.trees import TreeSpec, CONTENT_ID_BASE, generate_tree
+from submitter.config import Config
+from submitter.submit import SUCCESS, NOOP
+from submitter.watch import Watcher, changed_paths
+
+def test_changed_paths():
+    before = {'a': (1, 10, 100), 'b': (2, 20, 200), 'c': (3, 30, 300)}
+    after = {'a': (1, 10, 100), 'b': (5, 21, 200), 'd': (4, 40, 400)}
+
+    assert_equal(changed_paths(before, after), ['b', 'c', 'd'])
+    assert_equal(changed_paths(after, after), [])
+
+class TestWatcher():
+
+    def setup(self):
+        self.workspace = tempfile.mkdtemp()
+        self.asset_dir, self.envelope_dir = generate_tree(
+            self.workspace,
+            TreeSpec(assets=4, envelopes=3, body_size=100)
+        )
+
+        self.service = FakeContentService()
+        self.config = Config({
+            'CONTENT_SERVICE_URL': 'http://localhost:9000',
+            'CONTENT_SERVICE_APIKEY': '12341234',
+            'CONTENT_ID_BASE': CONTENT_ID_BASE,
+            'ASSET_DIR': self.asset_dir,
+            'ENVELOPE_DIR': self.envelope_dir
+        })
+        self.watcher = Watcher(
+            self.config,
+            session=self.service.session('http://localhost:9000'),
+            interval=0.01,
+            debounce=0.01
+        )
+
+    def teardown(self):
+        shutil.rmtree(self.workspace)
+
+    def test_submit_changes(self):
+        result = self.watcher.submit()
+        assert_equal(result.state, SUCCESS)
+        assert_equal(result.asset_result.uploaded, 4)
+        assert_equal(result.envelope_result.uploaded, 3)
+
+        # Nothing has changed, so nothing is checked or uploaded.
+        result = self.watcher.submit()
+        assert_equal(result.state, NOOP)
+        assert_equal(self.service.requests['/checkassets'], 1)
+        assert_equal(self.service.requests.get('/bulkasset'), 1)
+
+        asset_path = os.path.join(self.asset_dir, 'dir-0000', 'asset-000001.bin')
+        with open(asset_path, 'wb') as af:
+            af.write(b'a new revision of this asset')
+        assert_equal(self.watcher.poll(), [asset_path])
+
+        result = self.watcher.submit()
+        assert_equal(result.state, SUCCESS)
+        assert_equal(result.asset_result.uploaded, 1)
+        assert_equal(self.service.requests['/checkassets'], 2)
+        assert_equal(self.service.requests['/bulkasset'], 2)
+
+    def test_submit_reads_only_changes(self):
+        self.watcher.submit()
+
+        envelope_paths = sorted(
+            os.path.join(self.envelope_dir, name) for name in os.listdir(self.envelope_dir)
+        )
+        originals = {}
+        for path in envelope_paths:
+            with open(path, 'rb') as ef:
+                originals[path] = ef.read()
+
+        def rewrite(path, contents):
+            # Keep the size, mtime and inode, so that no change is seen.
+            st = os.stat(path)
+            with open(path, 'r+b') as ef:
+                ef.write(contents)
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        # Reading any of the garbled envelopes again would fail.
+        for path in envelope_paths:
+            rewrite(path, b'x' * len(originals[path]))
+
+        changed = envelope_paths[0]
+        document = json.loads(originals[changed].decode('utf-8'))
+        document['title'] = 'a new title'
+        with open(changed, 'w') as ef:
+            json.dump(document, ef)
+
+        result = self.watcher.submit()
+        assert_equal(result.state, SUCCESS)
+        assert_equal(result.envelope_result.uploaded, 1)
+        assert_equal(result.asset_result.uploaded, 0)
+
+        # Envelopes that refer to a changed asset are read again, though the
+        # envelopes themselves are unchanged.
+        referring = [
+            path for path in envelope_paths[1:]
+            if b'dir-0000/asset-000003.bin' in originals[path]
+        ]
+        assert_true(referring)
+        for path in referring:
+            rewrite(path, originals[path])
+
+        asset_path = os.path.join(self.asset_dir, 'dir-0000', 'asset-000003.bin')
+        with open(asset_path, 'wb') as af:
+            af.write(b'a new revision of this asset')
+
+        result = self.watcher.submit()
+        assert_equal(result.state, SUCCESS)
+        assert_equal(result.asset_result.uploaded, 1)
+        assert_equal(result.envelope_result.uploaded, len(referring))
+
+    def test_wait_for_changes(self):
+        self.watcher.submit()
+        stop = threading.Event()
+
+        envelope_path = os.path.join(self.envelope_dir, 'extra.json')
+        timer = threading.Timer(0.05, lambda: open(envelope_path, 'w').close())
+        timer.start()
+        changes = self.watcher.wait(stop)
+        timer.join()
+
+        assert_equal(changes, [envelope_path])
+
+        stop.set()
+        assert_is_none(self.watcher.wait(stop))
+
+    def test_retry_failed_submit(self):
+        self.watcher.poll()
+        assert_true(self.watcher.files)
+
+        # A failed submit is retried without waiting for a change.
+        self.watcher.pending = True
+        assert_equal(self.watcher.wait(threading.Event()), [])